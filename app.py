@@ -2,6 +2,7 @@ import streamlit as st
 import os
 import time
 import uuid
+import threading
 import shutil
 from pathlib import Path
 from dotenv import load_dotenv
@@ -13,6 +14,7 @@ from src.vector_store import VectorStore
 from src.query_processor import QueryProcessor
 from src.stock_data import StockDataHandler
 from src.llm_handler import LLMHandler
+from src.response_cache import SemanticResponseCache
 from src.utils import is_stock_query, extract_stock_symbols
 
 # Load environment variables
@@ -21,9 +23,23 @@ load_dotenv()
 # Paths and supported file types
 DOCUMENTS_DIR = "documents"
 UPLOADS_DIR = os.path.join(DOCUMENTS_DIR, "uploads")
+# Caches live under data/ with the index; documents/ is mounted read-only in Docker
+EMBEDDING_CACHE_DIR = os.path.join("data", "emb_cache")
+INDEX_DIR = os.path.join("data", "index")
+# Quiet period after the last index change before it is written to disk
+INDEX_SAVE_DELAY_SECONDS = 30
 SUPPORTED_FILE_EXTENSIONS = {".pdf", ".txt"}
 SUPPORTED_FILE_TYPES = ["pdf", "txt"]
 
+# Sidebar sample queries; their embeddings are computed once at startup
+SAMPLE_QUERIES = [
+    "What is Apple's stock performance this week?",
+    "Show me Microsoft stock trends",
+    "Summarize the latest earnings report",
+    "What are the market trends for tech stocks?",
+    "Compare AAPL vs MSFT stock performance"
+]
+
 # Page configuration
 st.set_page_config(
     page_title="Finance RAG System",
@@ -75,15 +91,17 @@ def handle_file_upload(system):
     uploaded_files = st.session_state.documents_uploader
     if uploaded_files:
         saved_files = []
+        saved_paths = []
         for file in uploaded_files:
             try:
                 destination = save_uploaded_file(file)
                 saved_files.append(Path(destination).name)
+                saved_paths.append(destination)
             except Exception as e:
                 st.error(f"Error saving {file.name}: {str(e)}")
         
         if saved_files:
-            refresh_document_index(system)
+            refresh_document_index(system, added=saved_paths)
             st.toast(f"✅ Stored {len(saved_files)} file(s): {', '.join(saved_files)}")
 
 
@@ -103,8 +121,10 @@ def save_uploaded_file(uploaded_file):
     unique_name = f"{safe_stem}_{uuid.uuid4().hex}{file_ext}"
     destination = os.path.join(UPLOADS_DIR, unique_name)
     
+    # Stream in 1 MiB blocks so memory stays flat regardless of file size
+    uploaded_file.seek(0)
     with open(destination, "wb") as f:
-        f.write(uploaded_file.getbuffer())
+        shutil.copyfileobj(uploaded_file, f, length=1024 * 1024)
     
     return destination
 
@@ -115,38 +135,111 @@ def list_uploaded_files():
     if not os.path.exists(UPLOADS_DIR):
         return files
     
-    for filename in sorted(os.listdir(UPLOADS_DIR)):
-        file_path = os.path.join(UPLOADS_DIR, filename)
-        if not os.path.isfile(file_path):
-            continue
-        file_ext = os.path.splitext(filename)[1].lower()
-        if file_ext not in SUPPORTED_FILE_EXTENSIONS:
-            continue
-        size_kb = os.path.getsize(file_path) / 1024 if os.path.exists(file_path) else 0
-        files.append({
-            "name": filename,
-            "path": file_path,
-            "size_kb": size_kb,
-            "key": filename.replace(" ", "_")
-        })
+    # scandir hands back cached file type and stat data, avoiding per-file syscalls
+    with os.scandir(UPLOADS_DIR) as entries:
+        for entry in entries:
+            if not entry.is_file():
+                continue
+            file_ext = os.path.splitext(entry.name)[1].lower()
+            if file_ext not in SUPPORTED_FILE_EXTENSIONS:
+                continue
+            files.append({
+                "name": entry.name,
+                "path": entry.path,
+                "size_kb": entry.stat().st_size / 1024,
+                "key": entry.name.replace(" ", "_")
+            })
+    
+    files.sort(key=lambda file_info: file_info["name"])
     return files
 
 
-def refresh_document_index(system):
+def count_indexed_files(documents):
+    """Count distinct source files behind a list of document chunks."""
+    return len({doc['path'] for doc in documents})
+
+
+def refresh_document_index(system, added=None, removed=None):
+    """Update the vector index for changed files, or rebuild it from disk when none are given."""
+    vector_store = system['vector_store']
+    if vector_store.index is None or (added is None and removed is None):
+        rebuild_document_index(system)
+        return
+    
+    with system['index_lock']:
+        # Drop chunks of removed files, plus any indexed files that vanished from disk
+        indexed_paths = {doc['path'] for doc in vector_store.documents}
+        removed_paths = set(removed or [])
+        removed_paths.update(path for path in indexed_paths if not os.path.exists(path))
+        stale_ids = [doc['id'] for doc in vector_store.documents if doc['path'] in removed_paths]
+        if stale_ids:
+            vector_store.remove_documents(stale_ids)
+        system['doc_processor'].forget_files(removed_paths)
+        
+        if added:
+            new_documents = system['doc_processor'].load_files(added)
+            if new_documents:
+                embeddings = system['doc_processor'].generate_embeddings(new_documents)
+                if len(embeddings):
+                    vector_store.add_documents(embeddings, new_documents)
+                else:
+                    st.warning("Unable to generate embeddings for the uploaded documents.")
+        
+        if not vector_store.documents:
+            vector_store.clear()
+            st.info("No documents available. Upload files to begin querying.")
+        system['documents'] = vector_store.documents
+        system['doc_processor'].retain_embeddings(vector_store.documents)
+        system['response_cache'].clear()
+    schedule_index_save(system)
+
+
+def rebuild_document_index(system):
     """Reload documents from disk and rebuild the vector index."""
-    documents = system['doc_processor'].load_documents(DOCUMENTS_DIR)
-    if documents:
-        embeddings = system['doc_processor'].generate_embeddings(documents)
-        if embeddings:
-            system['vector_store'].rebuild_index(embeddings, documents)
+    with system['index_lock']:
+        documents = system['doc_processor'].load_documents(DOCUMENTS_DIR)
+        if documents:
+            embeddings = system['doc_processor'].generate_embeddings(documents)
+            if len(embeddings):
+                system['vector_store'].rebuild_index(embeddings, documents)
+            else:
+                st.warning("Unable to generate embeddings for the current documents.")
         else:
-            st.warning("Unable to generate embeddings for the current documents.")
-    else:
-        system['vector_store'].index = None
-        system['vector_store'].documents = []
-        system['vector_store'].dimension = None
-        st.info("No documents available. Upload files to begin querying.")
-    system['documents'] = documents
+            system['vector_store'].clear()
+            st.info("No documents available. Upload files to begin querying.")
+        system['documents'] = documents
+        system['doc_processor'].retain_embeddings(documents)
+        system['response_cache'].clear()
+    schedule_index_save(system)
+
+
+def schedule_index_save(system):
+    """Save the vector index once it has gone INDEX_SAVE_DELAY_SECONDS without further changes.
+
+    Each save rewrites the whole index and chunk store, so a burst of uploads or
+    deletions is written once. If the process exits before the timer fires, the
+    next start finds the saved index stale and rebuilds it from the embedding cache.
+    """
+    with system['index_lock']:
+        if system['index_save_timer'] is not None:
+            system['index_save_timer'].cancel()
+        timer = threading.Timer(INDEX_SAVE_DELAY_SECONDS, persist_vector_index, args=(system,))
+        timer.daemon = True
+        system['index_save_timer'] = timer
+        timer.start()
+
+
+def persist_vector_index(system):
+    """Save the current vector index so the next start can load it instead of rebuilding."""
+    with system['index_lock']:
+        system['vector_store'].save(INDEX_DIR, system['doc_processor'].model_name)
+
+
+def index_matches_documents(indexed_documents, documents):
+    """Check whether a persisted index holds exactly the chunks currently on disk."""
+    def chunk_keys(docs):
+        return sorted((doc['path'], doc['chunk_id'], doc['chunk_hash']) for doc in docs)
+    return chunk_keys(indexed_documents) == chunk_keys(documents)
 
 
 def render_document_manager(system):
@@ -173,12 +266,12 @@ def render_document_manager(system):
             if col2.button("Remove", key=f"delete_{file_info['key']}"):
                 os.remove(file_info['path'])
                 st.info(f"Removed {file_info['name']}")
-                refresh_document_index(system)
+                refresh_document_index(system, removed=[file_info['path']])
                 st.rerun()
     else:
         st.caption("No uploaded files yet.")
     
-    st.caption(f"Total documents indexed: {len(system.get('documents', []))}")
+    st.caption(f"Total documents indexed: {count_indexed_files(system.get('documents', []))}")
 
 
 @st.cache_resource
@@ -189,21 +282,35 @@ def initialize_system():
             ensure_document_directories()
             
             # Initialize components
-            doc_processor = DocumentProcessor()
-            vector_store = VectorStore()
+            doc_processor = DocumentProcessor(cache_dir=EMBEDDING_CACHE_DIR)
+            vector_store = VectorStore(precision=os.getenv('EMBEDDING_PRECISION', 'float32'))
             query_processor = QueryProcessor()
             stock_handler = StockDataHandler()
             llm_handler = LLMHandler()
+            response_cache = SemanticResponseCache()
+            
+            sample_query_vecs = query_processor.encode_queries(SAMPLE_QUERIES)
+            if sample_query_vecs is None:
+                sample_query_vecs = []
             
             # Process documents
             documents = doc_processor.load_documents(DOCUMENTS_DIR)
             
-            embeddings = doc_processor.generate_embeddings(documents)
-            if embeddings:
-                vector_store.build_index(embeddings, documents)
-                st.success(f"Loaded {len(documents)} documents successfully!")
+            # Reuse the persisted index when it was built from the same chunks and model
+            if (documents and vector_store.load(INDEX_DIR, doc_processor.model_name)
+                    and index_matches_documents(vector_store.documents, documents)):
+                documents = vector_store.documents
+                st.success(f"Loaded saved index for {count_indexed_files(documents)} documents ({len(documents)} chunks)")
             else:
-                st.info("Upload documents to start receiving grounded responses.")
+                vector_store.clear()
+                embeddings = doc_processor.generate_embeddings(documents)
+                if len(embeddings):
+                    vector_store.build_index(embeddings, documents)
+                    vector_store.save(INDEX_DIR, doc_processor.model_name)
+                    st.success(f"Loaded {count_indexed_files(documents)} documents ({len(documents)} chunks) successfully!")
+                else:
+                    st.info("Upload documents to start receiving grounded responses.")
+            doc_processor.retain_embeddings(documents)
             
             return {
                 'doc_processor': doc_processor,
@@ -211,69 +318,21 @@ def initialize_system():
                 'query_processor': query_processor,
                 'stock_handler': stock_handler,
                 'llm_handler': llm_handler,
-                'documents': documents
+                'response_cache': response_cache,
+                'sample_query_vecs': dict(zip(SAMPLE_QUERIES, sample_query_vecs)),
+                'documents': documents,
+                # Guards index updates against the deferred save running on its timer thread
+                'index_lock': threading.RLock(),
+                'index_save_timer': None
             }
     except Exception as e:
         st.error(f"Error initializing system: {str(e)}")
         return None
 
-def main():
-    # Session cleanup: Clear documents on new session
-    if 'initialized' not in st.session_state:
-        # New session detected, clear uploaded documents
-        if os.path.exists(UPLOADS_DIR):
-            shutil.rmtree(UPLOADS_DIR)
-        os.makedirs(UPLOADS_DIR, exist_ok=True)
-        st.session_state.initialized = True
-    
-    # Header
-    st.markdown('<h1 class="main-header">💰 Finance RAG System</h1>', unsafe_allow_html=True)
-    
-    # Initialize system
-    system = initialize_system()
-    if not system:
-        st.stop()
-    
-    render_document_manager(system)
-    
-    # Sidebar
-    with st.sidebar:
-        st.markdown('<div class="sidebar-content">', unsafe_allow_html=True)
-        st.header("🔧 System Information")
-        
-        # API Key check
-        google_key = os.getenv('GOOGLE_API_KEY')
-        if google_key:
-            st.success("✅ Google API Key configured")
-        else:
-            st.error("❌ Google API Key not found")
-            st.info("Please set GOOGLE_API_KEY in your environment variables")
-        
-        # Document count
-        st.info(f"📄 Documents loaded: {len(system['documents'])}")
-        
-        # Sample queries
-        st.subheader("💡 Sample Queries")
-        sample_queries = [
-            "What is Apple's stock performance this week?",
-            "Show me Microsoft stock trends",
-            "Summarize the latest earnings report",
-            "What are the market trends for tech stocks?",
-            "Compare AAPL vs MSFT stock performance"
-        ]
-        
-        for query in sample_queries:
-            if st.button(query, key=f"sample_{hash(query)}"):
-                st.session_state.query_input = query
-        
-        st.markdown('</div>', unsafe_allow_html=True)
-    
-    # Initialize session state
-    if 'messages' not in st.session_state:
-        st.session_state.messages = []
-    if 'query_input' not in st.session_state:
-        st.session_state.query_input = ""
-    
+
+@st.fragment
+def render_chat_panel(system):
+    """Chat history and query input, rerun on its own so submissions skip the rest of the page."""
     # Chat interface
     st.subheader("💬 Ask me about finance and stocks!")
     
@@ -320,6 +379,10 @@ def main():
                 # Process the query
                 response_data = process_query(system, query)
                 
+                # Show the answer token-by-token; cached answers arrive complete
+                if response_data.get("answer_stream") is not None:
+                    st.write_stream(response_data["answer_stream"])
+                
                 processing_time = time.time() - start_time
                 
                 # Add bot response
@@ -336,8 +399,8 @@ def main():
                 # Show processing time
                 st.success(f"✅ Response generated in {processing_time:.2f} seconds")
                 
-                # Rerun to update the display
-                st.rerun()
+                # Rerun only the chat panel to update the display
+                st.rerun(scope="fragment")
                 
             except Exception as e:
                 st.error(f"Error processing query: {str(e)}")
@@ -346,17 +409,83 @@ def main():
                     "content": f"I encountered an error while processing your query: {str(e)}"
                 })
 
+
+def main():
+    # Session cleanup: Clear documents on new session
+    if 'initialized' not in st.session_state:
+        # New session detected, clear uploaded documents
+        if os.path.exists(UPLOADS_DIR):
+            shutil.rmtree(UPLOADS_DIR)
+        os.makedirs(UPLOADS_DIR, exist_ok=True)
+        st.session_state.initialized = True
+    
+    # Header
+    st.markdown('<h1 class="main-header">💰 Finance RAG System</h1>', unsafe_allow_html=True)
+    
+    # Initialize system
+    system = initialize_system()
+    if not system:
+        st.stop()
+    
+    render_document_manager(system)
+    
+    # Sidebar
+    with st.sidebar:
+        st.markdown('<div class="sidebar-content">', unsafe_allow_html=True)
+        st.header("🔧 System Information")
+        
+        # API Key check
+        google_key = os.getenv('GOOGLE_API_KEY')
+        if google_key:
+            st.success("✅ Google API Key configured")
+        else:
+            st.error("❌ Google API Key not found")
+            st.info("Please set GOOGLE_API_KEY in your environment variables")
+        
+        # Document count
+        st.info(f"📄 Documents loaded: {count_indexed_files(system['documents'])}")
+        
+        # Sample queries
+        st.subheader("💡 Sample Queries")
+        for query in SAMPLE_QUERIES:
+            if st.button(query, key=f"sample_{hash(query)}"):
+                st.session_state.query_input = query
+        
+        st.markdown('</div>', unsafe_allow_html=True)
+    
+    # Initialize session state
+    if 'messages' not in st.session_state:
+        st.session_state.messages = []
+    if 'query_input' not in st.session_state:
+        st.session_state.query_input = ""
+    
+    render_chat_panel(system)
+
 def process_query(system, query):
-    """Process a user query and return response with potential visualizations"""
+    """Process a user query and return response with potential visualizations.
+
+    Fresh answers are returned as an 'answer_stream' generator; 'answer' is
+    filled in (and the response cached) once the stream has been consumed.
+    """
     response_data = {"answer": "", "chart": None}
     
     # Check if it's a stock-related query
     is_stock = is_stock_query(query)
     stock_symbols = extract_stock_symbols(query) if is_stock else []
     
+    # Reuse the answer to a near-identical recent query about the same symbols
+    query_embedding = system['sample_query_vecs'].get(query)
+    if query_embedding is None:
+        query_embedding = system['query_processor'].encode_query(query)
+    cache_key = tuple(sorted(stock_symbols))
+    if query_embedding is not None:
+        cached_response = system['response_cache'].get(query_embedding, cache_key)
+        if cached_response is not None:
+            return cached_response
+    
     # Retrieve relevant documents
     relevant_docs = system['query_processor'].retrieve_documents(
-        query, system['vector_store'], top_k=3
+        query, system['vector_store'], top_k=3, query_embedding=query_embedding
     )
     
     # Get stock data if needed
@@ -391,11 +520,31 @@ def process_query(system, query):
             stock_data_summary = f"Unable to fetch stock data for {symbol}: {str(e)}"
     
     # Generate LLM response
-    context = "\n\n".join([doc["content"] for doc in relevant_docs])
+    # Stable document order keeps the prompt prefix identical for the same retrieved set
+    ordered_docs = system['query_processor'].order_for_context(relevant_docs)
+    context = "\n\n".join([item["doc"]["content"] for item in ordered_docs])
     
-    response_data["answer"] = system['llm_handler'].generate_response(
-        query, context, stock_data_summary
-    )
+    def stream_answer():
+        """Yield answer chunks as they arrive, then record the full answer and cache it if the model produced it."""
+        parts = []
+        stream = system['llm_handler'].stream_response(query, context, stock_data_summary)
+        while True:
+            try:
+                part = next(stream)
+            except StopIteration as stop:
+                completed = stop.value
+                break
+            parts.append(part)
+            yield part
+        
+        response_data["answer"] = "".join(parts).strip()
+        # Fallback text after an API error, or an empty answer, must not be served to other similar queries
+        if completed and response_data["answer"] and query_embedding is not None:
+            system['response_cache'].put(
+                query_embedding, {"answer": response_data["answer"], "chart": response_data["chart"]}, cache_key
+            )
+    
+    response_data["answer_stream"] = stream_answer()
     
     return response_data
 
@@ -1,137 +1,422 @@
 import os
+import re
+import sys
+import types
+import threading
 import json
-from typing import List, Dict
+import pickle
+import hashlib
+import uuid
+import multiprocessing
+from contextlib import contextmanager
+from functools import lru_cache
+from concurrent.futures import ProcessPoolExecutor
+from pathlib import Path
+from typing import Iterator, List, Dict, Optional, Tuple, Union
+import numpy as np
+import torch
 from sentence_transformers import SentenceTransformer
-import PyPDF2
 import streamlit as st
+from src.text_extraction import extract_text, read_file
+
+_WORD_RE = re.compile(r'\S+')
+
+# Embedding cache segments on disk before they are merged back into one file
+MAX_EMBEDDING_CACHE_SEGMENTS = 32
+
+def _content_hash(text: str) -> str:
+    """Stable SHA-256 hex digest of a piece of text"""
+    return hashlib.sha256(text.encode('utf-8')).hexdigest()
+
+def _scan_files(directory: str) -> Iterator[Tuple[str, os.stat_result]]:
+    """Yield (path, stat) for every file under directory, in os.walk's top-down order"""
+    subdirectories = []
+    with os.scandir(directory) as entries:
+        for entry in entries:
+            try:
+                if entry.is_dir(follow_symlinks=False):
+                    subdirectories.append(entry.path)
+                elif entry.is_file():
+                    yield entry.path, entry.stat()
+            except OSError:
+                continue
+    
+    for subdirectory in subdirectories:
+        yield from _scan_files(subdirectory)
+
+_MAIN_MODULE_LOCK = threading.Lock()
+
+@contextmanager
+def _script_free_main():
+    """Present a __main__ with no script path while worker processes are started.
+
+    spawn and forkserver workers re-run the parent's __main__ script; under
+    Streamlit that is app.py, which would import torch and the whole UI into
+    every PDF worker. Without a script path they only import what they unpickle.
+    """
+    with _MAIN_MODULE_LOCK:
+        original = sys.modules['__main__']
+        placeholder = types.ModuleType('__main__')
+        sys.modules['__main__'] = placeholder
+        try:
+            yield
+        finally:
+            # Streamlit swaps in a new __main__ on each rerun; don't clobber one set meanwhile
+            if sys.modules.get('__main__') is placeholder:
+                sys.modules['__main__'] = original
+
+@lru_cache(maxsize=None)
+def load_encoder(model_name: str) -> SentenceTransformer:
+    """Load a sentence transformer once per process and share it between callers"""
+    model = SentenceTransformer(model_name)
+    if torch.cuda.is_available():
+        # fp16 halves the bytes moved through the encoder matmuls on GPU
+        model = model.to('cuda').half()
+    
+    # Run one tiny batch so kernel selection and allocator warm-up happen at
+    # startup rather than on the first user query
+    model.encode(['warmup finance'], batch_size=1, show_progress_bar=False)
+    return model
 
 class DocumentProcessor:
-    def __init__(self, model_name: str = 'all-MiniLM-L6-v2'):
+    def __init__(self, model_name: str = 'all-MiniLM-L6-v2', cache_dir: Optional[str] = None,
+                 chunk_size: int = 180, chunk_overlap: int = 30):
         """Initialize document processor with sentence transformer model"""
         try:
-            self.model = SentenceTransformer(model_name)
+            self.model = load_encoder(model_name)
         except Exception as e:
             st.error(f"Error loading sentence transformer model: {e}")
             raise
+        self.model_name = model_name
+        self._batch_size = 64
+        
+        # Chunk sizes are in words; 180 words stays inside MiniLM's 256-token window
+        self.chunk_size = chunk_size
+        self.chunk_overlap = chunk_overlap
         self.supported_extensions = {'.txt', '.pdf'}
+        
+        # Embedding cache keyed by content hash, persisted when cache_dir is set.
+        # Stored as one contiguous matrix plus a key -> row map rather than a
+        # dict of per-document arrays, so lookups gather rows in a single call.
+        # On disk each batch of new rows is appended as its own segment file.
+        self._cache_segments_dir = Path(cache_dir) / 'embeddings' if cache_dir else None
+        self._cache_rows, self._cache_vectors = self._load_embedding_cache()
+        
+        # Extracted text keyed by path, reused while (mtime, size) is unchanged
+        self._file_cache_path = Path(cache_dir) / '.file_cache.pkl' if cache_dir else None
+        self._file_cache: Dict[str, Tuple[int, int, str]] = self._load_file_cache()
+        
+        # Documents produced per directory, reused while every file's (mtime, size) is unchanged
+        self._listing_cache: Dict[str, Tuple[tuple, List[Dict]]] = {}
+        
+        # PDF extraction pool, started on first use and kept for later loads
+        self._pdf_executor: Optional[ProcessPoolExecutor] = None
     
     def load_documents(self, documents_path: str) -> List[Dict]:
         """Load all documents from the specified directory"""
-        documents = []
-        
-        if not os.path.exists(documents_path):
+        if not os.path.isdir(documents_path):
             st.warning(f"Documents directory '{documents_path}' not found.")
-            return documents
-        
-        for root, _, filenames in os.walk(documents_path):
-            for filename in filenames:
-                file_path = os.path.join(root, filename)
-                file_ext = os.path.splitext(filename)[1].lower()
-                
-                if file_ext in self.supported_extensions:
-                    try:
-                        content = self._read_file(file_path, file_ext)
-                        if content.strip():
-                            documents.append({
-                                'id': len(documents),
-                                'filename': filename,
-                                'content': content,
-                                'path': file_path
-                            })
-                            st.success(f"✅ Loaded: {filename}")
-                    except Exception as e:
-                        st.error(f"❌ Failed to load {filename}: {str(e)}")
+            return []
+        
+        files = [(path, stat) for path, stat in _scan_files(documents_path)
+                 if os.path.splitext(path)[1].lower() in self.supported_extensions]
+        if not files:
+            return []
         
+        # Skip reading and chunking entirely when no file in the tree has changed
+        listing_key = os.path.abspath(documents_path)
+        signature = tuple((path, stat.st_mtime_ns, stat.st_size) for path, stat in files)
+        cached = self._listing_cache.get(listing_key)
+        if cached is not None and cached[0] == signature:
+            # Callers annotate the returned dicts, so hand out fresh copies
+            return [dict(doc) for doc in cached[1]]
+        
+        documents = self.load_files([path for path, _ in files])
+        self._listing_cache[listing_key] = (signature, [dict(doc) for doc in documents])
         return documents
     
-    def _read_file(self, file_path: str, file_ext: str) -> str:
-        """Read content from a file based on its extension"""
-        if file_ext == '.txt':
-            with open(file_path, 'r', encoding='utf-8', errors='ignore') as file:
-                return file.read()
-        
-        elif file_ext == '.pdf':
-            content = ""
-import os
-import json
-from typing import List, Dict
-from sentence_transformers import SentenceTransformer
-import PyPDF2
-import streamlit as st
-
-class DocumentProcessor:
-    def __init__(self, model_name: str = 'all-MiniLM-L6-v2'):
-        """Initialize document processor with sentence transformer model"""
-        try:
-            self.model = SentenceTransformer(model_name)
-        except Exception as e:
-            st.error(f"Error loading sentence transformer model: {e}")
-            raise
-        self.supported_extensions = {'.txt', '.pdf'}
+    def load_files(self, file_paths: List[str]) -> List[Dict]:
+        """Load and chunk the given files, skipping unsupported extensions"""
+        files = self._supported_files(file_paths)
+        return self._build_documents(files, self._read_files(files))
     
-    def load_documents(self, documents_path: str) -> List[Dict]:
-        """Load all documents from the specified directory"""
+    def load_documents_from_bytes(self, files: Dict[str, bytes]) -> List[Dict]:
+        """Load and chunk in-memory file contents keyed by file name, without touching disk"""
+        supported = self._supported_files(files)
+        results = []
+        for file_path, _, file_ext in supported:
+            try:
+                results.append(extract_text(files[file_path], file_ext))
+            except Exception as e:
+                results.append(e)
+        return self._build_documents(supported, results)
+    
+    def _supported_files(self, file_paths) -> List[Tuple[str, str, str]]:
+        """Pair each supported path with its file name and lower-cased extension"""
+        files = []
+        for file_path in file_paths:
+            filename = os.path.basename(file_path)
+            file_ext = os.path.splitext(filename)[1].lower()
+            if file_ext in self.supported_extensions:
+                files.append((file_path, filename, file_ext))
+        return files
+    
+    def _build_documents(self, files: List[Tuple[str, str, str]], results: List[Union[str, Exception]]) -> List[Dict]:
+        """Chunk extracted texts into document dicts, reporting files that failed to load"""
         documents = []
         
-        if not os.path.exists(documents_path):
-            st.warning(f"Documents directory '{documents_path}' not found.")
-            return documents
-        
-        for root, _, filenames in os.walk(documents_path):
-            for filename in filenames:
-                file_path = os.path.join(root, filename)
-                file_ext = os.path.splitext(filename)[1].lower()
-                
-                if file_ext in self.supported_extensions:
-                    try:
-                        content = self._read_file(file_path, file_ext)
-                        if content.strip():
-                            documents.append({
-                                'id': len(documents),
-                                'filename': filename,
-                                'content': content,
-                                'path': file_path
-                            })
-                            st.success(f"✅ Loaded: {filename}")
-                    except Exception as e:
-                        st.error(f"❌ Failed to load {filename}: {str(e)}")
+        for (file_path, filename, _), result in zip(files, results):
+            if isinstance(result, Exception):
+                st.error(f"❌ Failed to load {filename}: {str(result)}")
+                continue
+            
+            chunks = self._chunk_text(result)
+            for chunk_id, chunk in enumerate(chunks):
+                documents.append({
+                    'id': len(documents),
+                    'filename': filename,
+                    'content': chunk,
+                    'path': file_path,
+                    'chunk_id': chunk_id,
+                    'chunk_hash': _content_hash(chunk)
+                })
+            if chunks:
+                st.success(f"✅ Loaded: {filename}")
         
         return documents
     
-    def _read_file(self, file_path: str, file_ext: str) -> str:
-        """Read content from a file based on its extension"""
-        if file_ext == '.txt':
-            with open(file_path, 'r', encoding='utf-8', errors='ignore') as file:
-                return file.read()
+    def _read_files(self, files: List[Tuple[str, str, str]]) -> List[Union[str, Exception]]:
+        """Read files in order, skipping unchanged files and extracting PDFs in parallel worker processes"""
+        results: List[Union[str, Exception, None]] = [None] * len(files)
+        pending = []
+        for i, (file_path, _, file_ext) in enumerate(files):
+            try:
+                stat = os.stat(file_path)
+            except OSError as e:
+                results[i] = e
+                continue
+            
+            signature = (stat.st_mtime_ns, stat.st_size)
+            cached = self._file_cache.get(file_path)
+            if cached is not None and cached[:2] == signature:
+                results[i] = cached[2]
+            else:
+                pending.append((i, file_path, file_ext, signature))
+        
+        pdf_paths = [file_path for _, file_path, file_ext, _ in pending if file_ext == '.pdf']
+        futures = {}
+        
+        # PDFium is not thread-safe, so PDF extraction scales out over processes
+        if len(pdf_paths) > 1:
+            executor = self._get_pdf_executor()
+            # Workers are launched lazily inside submit()
+            with _script_free_main():
+                futures = {path: executor.submit(read_file, path, '.pdf') for path in pdf_paths}
         
-        elif file_ext == '.pdf':
-            content = ""
+        for i, file_path, file_ext, signature in pending:
             try:
-                with open(file_path, 'rb') as file:
-                    pdf_reader = PyPDF2.PdfReader(file)
-                    for page in pdf_reader.pages:
-                        content += page.extract_text() + "\n"
-                return content
+                if file_path in futures:
+                    content = futures[file_path].result()
+                else:
+                    content = read_file(file_path, file_ext)
+                self._file_cache[file_path] = (*signature, content)
+                results[i] = content
             except Exception as e:
-                st.error(f"Error reading PDF {file_path}: {str(e)}")
-                return ""
+                results[i] = e
         
-        return ""
+        if pending:
+            self._save_file_cache()
+        
+        return results
     
-    def generate_embeddings(self, documents: List[Dict]) -> List:
-        """Generate embeddings for all documents"""
-        if not documents:
+    def _get_pdf_executor(self) -> ProcessPoolExecutor:
+        """Return the shared PDF extraction pool, starting it on first use.
+
+        Workers never fork the running Streamlit/torch process: they come from a
+        fresh interpreter (forkserver where available, spawn elsewhere). Tasks must
+        be submitted inside _script_free_main(), which is when workers start, so
+        they import src.text_extraction rather than re-running the app script.
+        """
+        if self._pdf_executor is None:
+            start_method = 'forkserver' if 'forkserver' in multiprocessing.get_all_start_methods() else 'spawn'
+            self._pdf_executor = ProcessPoolExecutor(
+                max_workers=os.cpu_count() or 1,
+                mp_context=multiprocessing.get_context(start_method)
+            )
+        return self._pdf_executor
+    
+    def forget_files(self, file_paths):
+        """Drop removed files from the extracted-text cache"""
+        forgotten = [path for path in file_paths if self._file_cache.pop(path, None) is not None]
+        if forgotten:
+            self._save_file_cache()
+    
+    def _load_file_cache(self) -> Dict[str, Tuple[int, int, str]]:
+        """Load the persisted extracted-text cache, if any, dropping files deleted since it was saved"""
+        if self._file_cache_path is None or not self._file_cache_path.exists():
+            return {}
+        
+        try:
+            with open(self._file_cache_path, 'rb') as file:
+                cache = pickle.load(file)
+        except Exception as e:
+            st.warning(f"Ignoring unreadable file cache: {e}")
+            return {}
+        # The one full existence pass; afterwards removals arrive through forget_files
+        return {path: entry for path, entry in cache.items() if os.path.exists(path)}
+    
+    def _save_file_cache(self):
+        """Atomically persist the extracted-text cache"""
+        if self._file_cache_path is None:
+            return
+        
+        try:
+            self._file_cache_path.parent.mkdir(parents=True, exist_ok=True)
+            tmp_path = self._file_cache_path.with_suffix('.tmp')
+            with open(tmp_path, 'wb') as file:
+                pickle.dump(self._file_cache, file, protocol=pickle.HIGHEST_PROTOCOL)
+            os.replace(tmp_path, self._file_cache_path)
+        except Exception as e:
+            st.warning(f"Unable to persist file cache: {e}")
+    
+    def _chunk_text(self, text: str) -> List[str]:
+        """Split text into overlapping word windows, preserving the original formatting"""
+        spans = [match.span() for match in _WORD_RE.finditer(text)]
+        if not spans:
             return []
         
-        texts = [doc['content'] for doc in documents]
+        step = max(self.chunk_size - self.chunk_overlap, 1)
+        chunks = []
+        for start in range(0, len(spans), step):
+            end = min(start + self.chunk_size, len(spans))
+            chunks.append(text[spans[start][0]:spans[end - 1][1]])
+            if end == len(spans):
+                break
+        
+        return chunks
+    
+    def generate_embeddings(self, documents: List[Dict]) -> np.ndarray:
+        """Generate a float32 embedding matrix for all documents, reusing cached vectors for unchanged content"""
+        if not documents:
+            return self._cache_vectors[:0]
+        
+        keys = [self._cache_key(doc) for doc in documents]
+        
+        # Encode each distinct uncached content once; duplicates share the vector
+        misses = {}
+        for doc, key in zip(documents, keys):
+            if key not in self._cache_rows:
+                misses.setdefault(key, doc['content'])
         
         try:
-            with st.spinner("Generating document embeddings..."):
-                embeddings = self.model.encode(texts)
-            return embeddings.tolist()
+            if misses:
+                with st.spinner("Generating document embeddings..."):
+                    new_embeddings = self.model.encode(
+                        list(misses.values()),
+                        batch_size=self._batch_size,
+                        show_progress_bar=False,
+                        convert_to_numpy=True,
+                        normalize_embeddings=True
+                    )
+                start = len(self._cache_vectors)
+                self._cache_vectors = np.concatenate([self._cache_vectors, new_embeddings.astype(np.float32, copy=False)])
+                for row, key in enumerate(misses, start=start):
+                    self._cache_rows[key] = row
+                self._save_embedding_cache(list(misses), start)
+            
+            rows = np.fromiter((self._cache_rows[key] for key in keys), dtype=np.int64, count=len(keys))
+            return self._cache_vectors[rows]
         except Exception as e:
             st.error(f"Error generating embeddings: {e}")
-            return []
+            return self._cache_vectors[:0]
+    
+    def _cache_key(self, doc: Dict) -> str:
+        """Key a chunk's embedding by model name and content hash so caches never mix models"""
+        chunk_hash = doc.get('chunk_hash') or _content_hash(doc['content'])
+        return f"{self.model_name}:{chunk_hash}"
+    
+    def retain_embeddings(self, documents: List[Dict]):
+        """Drop cached embeddings of chunks that are no longer among documents, compacting the cache on disk.
+
+        An empty document list is ignored rather than treated as "keep nothing", so
+        a temporarily empty or unmounted documents directory cannot wipe the cache.
+        """
+        if not documents:
+            return
+        
+        live_keys = {self._cache_key(doc) for doc in documents}
+        kept = [(key, row) for key, row in self._cache_rows.items() if key in live_keys]
+        if len(kept) == len(self._cache_rows):
+            return
+        
+        rows = np.fromiter((row for _, row in kept), dtype=np.int64, count=len(kept))
+        self._cache_vectors = self._cache_vectors[rows]
+        self._cache_rows = {key: row for row, (key, _) in enumerate(kept)}
+        
+        if self._cache_segments_dir is not None:
+            try:
+                self._compact_embedding_cache()
+            except Exception as e:
+                st.warning(f"Unable to persist embedding cache: {e}")
+    
+    def _load_embedding_cache(self) -> Tuple[Dict[str, int], np.ndarray]:
+        """Load persisted embedding segments from disk, if any, as a key -> row map and a vector matrix"""
+        dimension = self.model.get_sentence_embedding_dimension()
+        rows: Dict[str, int] = {}
+        blocks = [np.empty((0, dimension), dtype=np.float32)]
+        if self._cache_segments_dir is None or not self._cache_segments_dir.is_dir():
+            return rows, blocks[0]
+        
+        for segment in sorted(self._cache_segments_dir.glob('*.npz')):
+            try:
+                with np.load(segment) as data:
+                    keys, vectors = data['keys'].tolist(), data['vectors'].astype(np.float32, copy=False)
+            except Exception as e:
+                st.warning(f"Ignoring unreadable embedding cache segment {segment.name}: {e}")
+                continue
+            if vectors.shape != (len(keys), dimension):
+                continue
+            
+            # A key can appear in several segments after a crash mid-compaction; keep its first row
+            take = []
+            for i, key in enumerate(keys):
+                if key not in rows:
+                    rows[key] = len(rows)
+                    take.append(i)
+            blocks.append(vectors[take])
+        
+        return rows, np.concatenate(blocks)
+    
+    def _save_embedding_cache(self, keys: List[str], start: int):
+        """Persist rows added from start on as a new segment, so a miss writes only its own vectors"""
+        if self._cache_segments_dir is None:
+            return
+        
+        try:
+            if len(list(self._cache_segments_dir.glob('*.npz'))) >= MAX_EMBEDDING_CACHE_SEGMENTS:
+                self._compact_embedding_cache()
+            else:
+                self._write_embedding_segment(keys, self._cache_vectors[start:])
+        except Exception as e:
+            st.warning(f"Unable to persist embedding cache: {e}")
+    
+    def _compact_embedding_cache(self):
+        """Replace every segment on disk with a single segment holding the in-memory cache"""
+        old_segments = list(self._cache_segments_dir.glob('*.npz'))
+        if self._cache_rows:
+            # Rows are kept in key insertion order, so the two arrays stay aligned
+            self._write_embedding_segment(list(self._cache_rows), self._cache_vectors)
+        for segment in old_segments:
+            segment.unlink(missing_ok=True)
+    
+    def _write_embedding_segment(self, keys: List[str], vectors: np.ndarray):
+        """Atomically write one cache segment (write-then-rename)"""
+        self._cache_segments_dir.mkdir(parents=True, exist_ok=True)
+        path = self._cache_segments_dir / f'{uuid.uuid4().hex}.npz'
+        tmp_path = path.with_suffix('.tmp')
+        with open(tmp_path, 'wb') as file:
+            np.savez(file, keys=np.array(keys), vectors=vectors)
+        os.replace(tmp_path, path)
     
     def encode_query(self, query: str):
         """Encode a single query"""
@@ -139,4 +424,4 @@ class DocumentProcessor:
             return self.model.encode([query])[0]
         except Exception as e:
             st.error(f"Error encoding query: {e}")
-            return None
\ No newline at end of file
+            return None
@@ -1,15 +1,34 @@
 import os
+import time
 import google.generativeai as genai
-from typing import Optional
+from typing import Generator, Optional
 import streamlit as st
 
+GEMINI_MODEL = 'gemini-1.5-flash'
+
+# Appended to a partially streamed answer when the stream fails
+INTERRUPTED_RESPONSE_NOTICE = "\n\n⚠️ *The response was interrupted and may be incomplete. Please try again.*"
+
+# How long a successful live API check is trusted before probing again
+API_STATUS_TTL_SECONDS = 60
+
+SYSTEM_PROMPT = """You are a helpful financial assistant with access to financial documents and real-time stock data. 
+Provide accurate, informative, and well-structured responses to financial queries.
+When relevant, include specific numbers, trends, and insights from the provided context.
+Keep responses concise but comprehensive, and always cite your sources when using specific data points."""
+
 class LLMHandler:
     def __init__(self):
         """Initialize Google Gemini client"""
         self.api_key = os.getenv('GOOGLE_API_KEY')
+        self._status_cached = None
+        self._status_ts = 0.0
         if self.api_key:
             genai.configure(api_key=self.api_key)
-            self.model = genai.GenerativeModel('gemini-1.5-flash')
+            self.model = genai.GenerativeModel(GEMINI_MODEL)
+            # The static system prompt travels as a system instruction instead of
+            # being re-concatenated into every request
+            self.assistant_model = genai.GenerativeModel(GEMINI_MODEL, system_instruction=SYSTEM_PROMPT)
             self.client_initialized = True
         else:
             self.client_initialized = False
@@ -17,39 +36,62 @@ class LLMHandler:
     
     def generate_response(self, query: str, document_context: str = "", stock_data: str = "") -> str:
         """Generate response using Google Gemini"""
+        return "".join(self.stream_response(query, document_context, stock_data)).strip()
+    
+    def stream_response(self, query: str, document_context: str = "", stock_data: str = "") -> Generator[str, None, bool]:
+        """Stream the Gemini response text chunk by chunk as it is generated.
+
+        Falls back to a canned response when the API is unavailable, fails before
+        any text arrives or returns no text (e.g. a safety block), and ends with a
+        short notice if it fails mid-answer. The generator returns True only if
+        the whole answer came from the model.
+        """
         if not self.client_initialized:
-            return self._fallback_response(query, document_context, stock_data)
+            yield self._fallback_response(query, document_context, stock_data)
+            return False
         
+        streamed_text = False
         try:
             # Construct the prompt
-            system_prompt = """You are a helpful financial assistant with access to financial documents and real-time stock data. 
-            Provide accurate, informative, and well-structured responses to financial queries. 
-            When relevant, include specific numbers, trends, and insights from the provided context.
-            Keep responses concise but comprehensive, and always cite your sources when using specific data points."""
-            
             user_prompt = self._construct_user_prompt(query, document_context, stock_data)
             
-            full_prompt = f"{system_prompt}\n\n{user_prompt}"
+            # Make a streaming API call so the first tokens can be shown immediately
+            response = self.assistant_model.generate_content(user_prompt, stream=True)
             
-            # Make API call
-            response = self.model.generate_content(full_prompt)
-            
-            return response.text.strip()
+            for chunk in response:
+                # The final chunk may carry only finish metadata and no text parts
+                if chunk.parts:
+                    yield chunk.text
+                    streamed_text = True
             
         except Exception as e:
             st.error(f"Error generating LLM response: {e}")
-            return self._fallback_response(query, document_context, stock_data)
+            if streamed_text:
+                yield INTERRUPTED_RESPONSE_NOTICE
+            else:
+                yield self._fallback_response(query, document_context, stock_data)
+            return False
+        
+        if not streamed_text:
+            yield self._fallback_response(query, document_context, stock_data)
+            return False
+        return True
     
     def _construct_user_prompt(self, query: str, document_context: str, stock_data: str) -> str:
-        """Construct the user prompt with context"""
-        prompt_parts = [f"User Query: {query}"]
+        """Construct the user prompt with context.
+
+        Stable content comes first and the query last, so prompts that retrieve the
+        same documents share a prefix that backends can cache.
+        """
+        prompt_parts = []
         
         if document_context.strip():
-            prompt_parts.append(f"\nRelevant Financial Documents:\n{document_context}")
+            prompt_parts.append(f"Relevant Financial Documents:\n{document_context}\n")
         
         if stock_data.strip():
-            prompt_parts.append(f"\nReal-time Stock Data:\n{stock_data}")
+            prompt_parts.append(f"Real-time Stock Data:\n{stock_data}\n")
         
+        prompt_parts.append(f"User Query: {query}")
         prompt_parts.append("\nPlease provide a comprehensive answer based on the available information.")
         
         return "\n".join(prompt_parts)
@@ -155,17 +197,25 @@ Provide a brief sentiment analysis (Bullish/Bearish/Neutral) with reasoning."""
                 "message": "Google Gemini client initialization failed"
             }
         
+        # Reuse a recent successful check instead of paying another round-trip
+        if self._status_cached and time.monotonic() - self._status_ts < API_STATUS_TTL_SECONDS:
+            return self._status_cached
+        
         try:
             # Test API with a simple request
             response = self.model.generate_content("test")
             
-            return {
+            self._status_cached = {
                 "status": "active",
                 "message": "Google Gemini API is configured and working",
-                "model": "gemini-1.5-flash"
+                "model": GEMINI_MODEL
             }
+            self._status_ts = time.monotonic()
+            return self._status_cached
             
         except Exception as e:
+            # Failures are never cached, so the next call probes again
+            self._status_cached = None
             return {
                 "status": "error",
                 "message": f"API test failed: {str(e)}"
@@ -1,29 +1,187 @@
-from typing import List, Dict
+import threading
+from functools import lru_cache
+from typing import Callable, List, Dict
+import numpy as np
 import streamlit as st
-from sentence_transformers import SentenceTransformer
+from src.document_processor import load_encoder
+from src.utils import compile_keyword_pattern
+
+# Stock-related keywords
+_STOCK_KEYWORDS = frozenset({'stock', 'share', 'price', 'ticker', 'market', 'trading',
+                             'volume', 'chart', 'performance', 'trend'})
+
+# Financial analysis keywords
+_ANALYSIS_KEYWORDS = frozenset({'earnings', 'revenue', 'profit', 'financial', 'report',
+                                'quarterly', 'annual', 'balance sheet', 'income statement'})
+
+# Comparison keywords
+_COMPARISON_KEYWORDS = frozenset({'compare', 'vs', 'versus', 'difference', 'better',
+                                  'against', 'contrast'})
+
+# Query types checked in priority order, each against one compiled pattern
+_QUERY_TYPE_PATTERNS = [
+    ("stock_query", compile_keyword_pattern(_STOCK_KEYWORDS)),
+    ("financial_analysis", compile_keyword_pattern(_ANALYSIS_KEYWORDS)),
+    ("comparison", compile_keyword_pattern(_COMPARISON_KEYWORDS))
+]
+
+# Retrieval terms appended to a query for each query type
+_QUERY_ENHANCEMENTS = {
+    "stock_query": "stock price market performance trading",
+    "financial_analysis": "financial earnings revenue profit report",
+    "comparison": "comparison analysis performance metrics",
+    "general": "financial analysis report"
+}
+
+# Closes each document in the LLM context; the header is precomputed by VectorStore
+_CONTEXT_ENTRY_SUFFIX = "\n---\n"
+
+class _PendingQuery:
+    __slots__ = ('text', 'done', 'embedding', 'error', 'leader')
+    
+    def __init__(self, text: str):
+        self.text = text
+        # Set once the result is in, or earlier to hand this request's caller leadership
+        self.done = threading.Event()
+        self.embedding = None
+        self.error = None
+        self.leader = False
+    
+    @property
+    def finished(self) -> bool:
+        return self.embedding is not None or self.error is not None
+
+class _QueryBatcher:
+    """Coalesce concurrent single-query encodes into shared batched forward passes.
+
+    The first caller to arrive becomes the leader and encodes whatever is queued
+    until its own request is served, then hands leadership to the oldest waiting
+    caller, so no caller keeps working for other sessions indefinitely. An idle
+    batcher encodes immediately, so a lone query pays no extra wait.
+    """
+    
+    def __init__(self, encode_batch: Callable[[List[str]], np.ndarray], max_batch_size: int = 32):
+        self._encode_batch = encode_batch
+        self._max_batch_size = max_batch_size
+        self._pending: List[_PendingQuery] = []
+        self._busy = False
+        self._lock = threading.Lock()
+    
+    def encode(self, text: str) -> np.ndarray:
+        """Encode one query, sharing the forward pass with any concurrent callers"""
+        request = _PendingQuery(text)
+        with self._lock:
+            self._pending.append(request)
+            if not self._busy:
+                self._busy = True
+                request.leader = True
+        
+        if not request.leader:
+            request.done.wait()
+        if request.leader and not request.finished:
+            self._lead(request)
+        
+        if request.error is not None:
+            raise request.error
+        return request.embedding
+    
+    def _lead(self, own: _PendingQuery):
+        """Encode queued batches until own is served, then pass leadership on"""
+        batch = []
+        try:
+            while not own.finished:
+                with self._lock:
+                    batch = self._pending[:self._max_batch_size]
+                    del self._pending[:self._max_batch_size]
+                self._run(batch)
+                batch = []
+        except BaseException as e:
+            # Fail the batch in flight so its callers are not left waiting; they get
+            # an ordinary error rather than this thread's interrupt
+            for request in batch:
+                if not request.finished:
+                    request.error = RuntimeError(f"Query encoding was interrupted: {e!r}")
+                request.done.set()
+            raise
+        finally:
+            with self._lock:
+                if self._pending:
+                    successor = self._pending[0]
+                    successor.leader = True
+                    successor.done.set()
+                else:
+                    self._busy = False
+    
+    def _run(self, batch: List[_PendingQuery]):
+        """Encode one batch and wake its callers"""
+        try:
+            embeddings = self._encode_batch([request.text for request in batch])
+            for request, embedding in zip(batch, embeddings):
+                request.embedding = embedding
+        except Exception as e:
+            for request in batch:
+                request.error = e
+        for request in batch:
+            request.done.set()
 
 class QueryProcessor:
     def __init__(self, model_name: str = 'all-MiniLM-L6-v2'):
         """Initialize query processor with the same model as document processor"""
         try:
-            self.model = SentenceTransformer(model_name)
+            self.model = load_encoder(model_name)
         except Exception as e:
             st.error(f"Error loading query processing model: {e}")
             raise
+        self._batch_size = 32
+        self._batcher = _QueryBatcher(self._encode_batch, max_batch_size=self._batch_size)
+        
+        # Per-instance LRU of query text -> embedding bytes, so resubmitted queries skip the model
+        self._encode_cached = lru_cache(maxsize=1024)(self._encode_to_bytes)
+    
+    def _encode_batch(self, queries: List[str]) -> np.ndarray:
+        """Run one forward pass over a list of queries, returning unit-normalized float32 vectors"""
+        embeddings = self.model.encode(
+            queries,
+            batch_size=self._batch_size,
+            show_progress_bar=False,
+            convert_to_numpy=True,
+            normalize_embeddings=True
+        )
+        # The shared encoder runs in fp16 on GPU (see load_encoder); FAISS and the
+        # caches work in float32, so pin the dtype at this boundary
+        return embeddings.astype(np.float32, copy=False)
+    
+    def _encode_to_bytes(self, query: str) -> bytes:
+        """Encode one query through the batcher, as immutable float32 bytes for caching"""
+        return np.asarray(self._batcher.encode(query), dtype=np.float32).tobytes()
     
     def encode_query(self, query: str):
-        """Encode a query into embedding"""
+        """Encode a query into embedding, batched with concurrent sessions' queries and cached by text"""
         try:
-            return self.model.encode([query])[0]
+            # Read-only view over the cached bytes, so callers cannot corrupt the cache
+            return np.frombuffer(self._encode_cached(query), dtype=np.float32)
         except Exception as e:
             st.error(f"Error encoding query: {e}")
             return None
     
-    def retrieve_documents(self, query: str, vector_store, top_k: int = 5) -> List[Dict]:
-        """Retrieve most relevant documents for a query"""
+    def encode_queries(self, queries: List[str]):
+        """Encode several queries in a single batched forward pass"""
+        try:
+            return self._encode_batch(queries)
+        except Exception as e:
+            st.error(f"Error encoding queries: {e}")
+            return None
+    
+    def retrieve_documents(self, query: str, vector_store, top_k: int = 5, query_embedding=None) -> List[Dict]:
+        """Retrieve most relevant documents for a query, optionally reusing a precomputed embedding.
+
+        Returns hits best-first as {'doc', 'score', 'distance'} dicts, where 'doc' is the
+        stored document itself (not a copy) and must not be modified.
+        """
         try:
             # Encode the query
-            query_embedding = self.encode_query(query)
+            if query_embedding is None:
+                query_embedding = self.encode_query(query)
             
             if query_embedding is None:
                 return []
@@ -35,20 +193,14 @@ class QueryProcessor:
                 st.warning("No relevant documents found")
                 return []
             
-            # Retrieve documents and add similarity scores
+            # Pair documents with their scores; scores are cosine similarities,
+            # already sorted best-first by FAISS
             retrieved_docs = []
-            for doc_idx, distance in search_results:
+            for doc_idx, score in search_results:
                 doc = vector_store.get_document(doc_idx)
                 if doc:
-                    # Convert L2 distance to similarity score (lower distance = higher similarity)
-                    similarity_score = 1.0 / (1.0 + distance)
-                    doc_with_score = doc.copy()
-                    doc_with_score['similarity_score'] = similarity_score
-                    doc_with_score['distance'] = distance
-                    retrieved_docs.append(doc_with_score)
-            
-            # Sort by similarity score (highest first)
-            retrieved_docs.sort(key=lambda x: x['similarity_score'], reverse=True)
+                    # Distance is the squared L2 distance between the unit vectors
+                    retrieved_docs.append({'doc': doc, 'score': score, 'distance': 2.0 - 2.0 * score})
             
             return retrieved_docs
             
@@ -57,63 +209,55 @@ class QueryProcessor:
             return []
     
     def filter_documents_by_threshold(self, documents: List[Dict], threshold: float = 0.3) -> List[Dict]:
-        """Filter documents by similarity threshold"""
-        return [doc for doc in documents if doc.get('similarity_score', 0) >= threshold]
+        """Filter retrieved documents by similarity threshold"""
+        return [item for item in documents if item['score'] >= threshold]
     
     def prepare_context(self, documents: List[Dict], max_length: int = 2000) -> str:
-        """Prepare context string from retrieved documents"""
+        """Prepare context string from retrieved documents.
+
+        Documents are chosen by relevance until the budget is spent, then emitted in a
+        stable order so the same retrieved set always yields the same prompt prefix.
+        """
         if not documents:
             return ""
         
-        context_parts = []
+        selected = []
         current_length = 0
         
-        for doc in documents:
-            doc_content = f"Document: {doc['filename']}\n{doc['content']}\n---\n"
+        for item in documents:
+            doc = item['doc']
+            # Length of the entry from lengths precomputed at index time, so
+            # documents over budget are never assembled
+            doc_length = len(doc['_ctx_prefix']) + doc['_content_len'] + len(_CONTEXT_ENTRY_SUFFIX)
             
-            if current_length + len(doc_content) > max_length and context_parts:
+            if current_length + doc_length > max_length and selected:
                 break
             
-            context_parts.append(doc_content)
-            current_length += len(doc_content)
+            selected.append(item)
+            current_length += doc_length
         
-        return "\n".join(context_parts)
+        return "\n".join(
+            item['doc']['_ctx_prefix'] + item['doc']['content'] + _CONTEXT_ENTRY_SUFFIX
+            for item in self.order_for_context(selected)
+        )
+    
+    @staticmethod
+    def order_for_context(documents: List[Dict]) -> List[Dict]:
+        """Sort retrieved documents by source and chunk rather than score, for byte-stable prompts"""
+        return sorted(documents, key=lambda item: (item['doc']['filename'], item['doc']['path'], item['doc']['chunk_id']))
     
     def get_query_type(self, query: str) -> str:
         """Determine the type of query to better handle it"""
         query_lower = query.lower()
         
-        # Stock-related keywords
-        stock_keywords = ['stock', 'share', 'price', 'ticker', 'market', 'trading', 
-                         'volume', 'chart', 'performance', 'trend']
-        
-        # Financial analysis keywords
-        analysis_keywords = ['earnings', 'revenue', 'profit', 'financial', 'report',
-                           'quarterly', 'annual', 'balance sheet', 'income statement']
-        
-        # Comparison keywords
-        comparison_keywords = ['compare', 'vs', 'versus', 'difference', 'better',
-                             'against', 'contrast']
-        
-        if any(keyword in query_lower for keyword in stock_keywords):
-            return "stock_query"
-        elif any(keyword in query_lower for keyword in analysis_keywords):
-            return "financial_analysis"
-        elif any(keyword in query_lower for keyword in comparison_keywords):
-            return "comparison"
-        else:
-            return "general"
+        for query_type, pattern in _QUERY_TYPE_PATTERNS:
+            if pattern.search(query_lower):
+                return query_type
+        return "general"
     
     def enhance_query(self, query: str, query_type: str) -> str:
         """Enhance query based on its type for better retrieval"""
-        enhancements = {
-            "stock_query": "stock price market performance trading",
-            "financial_analysis": "financial earnings revenue profit report",
-            "comparison": "comparison analysis performance metrics",
-            "general": "financial analysis report"
-        }
-        
-        enhancement = enhancements.get(query_type, "")
+        enhancement = _QUERY_ENHANCEMENTS.get(query_type, "")
         return f"{query} {enhancement}".strip()
     
     def get_retrieval_summary(self, documents: List[Dict]) -> Dict:
@@ -121,8 +265,8 @@ class QueryProcessor:
         if not documents:
             return {"total": 0, "sources": [], "avg_similarity": 0}
         
-        sources = [doc['filename'] for doc in documents]
-        similarities = [doc.get('similarity_score', 0) for doc in documents]
+        sources = [item['doc']['filename'] for item in documents]
+        similarities = [item['score'] for item in documents]
         
         return {
             "total": len(documents),
@@ -0,0 +1,66 @@
+import time
+import threading
+import numpy as np
+from typing import Dict, List, Optional, Tuple
+
+class SemanticResponseCache:
+    def __init__(self, threshold: float = 0.95, ttl_seconds: float = 300, max_entries: int = 256):
+        """Initialize a response cache looked up by query embedding similarity"""
+        self.threshold = threshold
+        self.ttl_seconds = ttl_seconds
+        self.max_entries = max_entries
+        self._vectors = None  # Unit-normalized query embeddings, one row per entry
+        self._entries: List[Tuple[float, Tuple, Dict]] = []  # (created_at, key, response)
+        self._lock = threading.Lock()
+    
+    def get(self, query_embedding: np.ndarray, key: Tuple = ()) -> Optional[Dict]:
+        """Return the cached response of the most similar fresh query with the same key"""
+        with self._lock:
+            self._evict_expired()
+            if not self._entries:
+                return None
+            
+            similarities = self._vectors @ self._normalize(query_embedding)
+            for i, (_, entry_key, _) in enumerate(self._entries):
+                if entry_key != key:
+                    similarities[i] = -1.0
+            
+            best = int(np.argmax(similarities))
+            if similarities[best] >= self.threshold:
+                return self._entries[best][2]
+            return None
+    
+    def put(self, query_embedding: np.ndarray, response: Dict, key: Tuple = ()):
+        """Cache a response for a query embedding"""
+        vector = self._normalize(query_embedding).reshape(1, -1)
+        with self._lock:
+            self._evict_expired()
+            if len(self._entries) >= self.max_entries:
+                self._entries.pop(0)
+                self._vectors = self._vectors[1:]
+            
+            self._entries.append((time.monotonic(), key, response))
+            self._vectors = vector if self._vectors is None else np.vstack([self._vectors, vector])
+    
+    def clear(self):
+        """Drop all cached responses"""
+        with self._lock:
+            self._entries = []
+            self._vectors = None
+    
+    def _evict_expired(self):
+        """Drop entries older than the TTL (entries are kept in insertion order)"""
+        cutoff = time.monotonic() - self.ttl_seconds
+        expired = 0
+        while expired < len(self._entries) and self._entries[expired][0] < cutoff:
+            expired += 1
+        if expired:
+            self._entries = self._entries[expired:]
+            self._vectors = self._vectors[expired:]
+    
+    @staticmethod
+    def _normalize(vector: np.ndarray) -> np.ndarray:
+        """Flatten to float32 and scale to unit length so dot products are cosine similarities"""
+        vector = np.asarray(vector, dtype=np.float32).ravel()
+        norm = np.linalg.norm(vector)
+        return vector / norm if norm > 0 else vector
@@ -1,29 +1,63 @@
+import threading
 import yfinance as yf
+from cachetools import TTLCache
 import plotly.graph_objects as go
 import plotly.express as px
 from plotly.subplots import make_subplots
 import pandas as pd
+import numpy as np
 import streamlit as st
 from typing import Optional, List, Dict
-from datetime import datetime, timedelta
+from datetime import datetime
+
+# Upper bound on points sent to the browser per chart trace; longer histories
+# are bucketed down to about this many bars
+MAX_CHART_POINTS = 2000
+
+def _bucket_size(num_rows: int, max_points: int = MAX_CHART_POINTS) -> int:
+    """Rows per chart point so that num_rows rows fit in at most max_points points"""
+    return max(1, -(-num_rows // max_points))
+
+def _downsample_ohlcv(data: pd.DataFrame, max_points: int = MAX_CHART_POINTS) -> pd.DataFrame:
+    """Aggregate consecutive rows into OHLCV buckets so at most max_points rows remain"""
+    if len(data) <= max_points:
+        return data
+    
+    bucket_size = _bucket_size(len(data), max_points)
+    buckets = np.arange(len(data)) // bucket_size
+    grouped = data.groupby(buckets)
+    downsampled = grouped.agg({'Open': 'first', 'High': 'max', 'Low': 'min', 'Close': 'last', 'Volume': 'sum'})
+    # Label each bucket with the timestamp of its first row
+    downsampled.index = data.index[::bucket_size]
+    return downsampled
 
 class StockDataHandler:
     def __init__(self):
         """Initialize stock data handler"""
-        self.cache = {}  # Simple cache for API calls
+        # Bounded cache of fetched frames keyed by (symbol, period, interval),
+        # expiring after 5 minutes on a monotonic clock; shared across sessions
+        self.cache = TTLCache(maxsize=256, ttl=300)
+        self._cache_lock = threading.Lock()
+    
+    def _get_cached(self, key: tuple) -> Optional[pd.DataFrame]:
+        """Return a fresh cached frame, or None"""
+        with self._cache_lock:
+            return self.cache.get(key)
+    
+    def _set_cached(self, key: tuple, data: pd.DataFrame):
+        """Store a fetched frame in the cache"""
+        with self._cache_lock:
+            self.cache[key] = data
     
     def get_stock_data(self, symbol: str, period: str = "1mo", interval: str = "1d") -> Optional[pd.DataFrame]:
         """Fetch stock data from Yahoo Finance"""
+        symbol = symbol.upper()
         try:
-            # Create cache key
-            cache_key = f"{symbol}_{period}_{interval}"
-            
-            # Check cache first (simple time-based cache)
-            if cache_key in self.cache:
-                cached_data, timestamp = self.cache[cache_key]
-                # Cache for 5 minutes
-                if datetime.now() - timestamp < timedelta(minutes=5):
-                    return cached_data
+            # Check cache first
+            cache_key = (symbol, period, interval)
+            cached_data = self._get_cached(cache_key)
+            if cached_data is not None:
+                return cached_data
             
             # Fetch data from yfinance
             ticker = yf.Ticker(symbol)
@@ -34,7 +68,7 @@ class StockDataHandler:
                 return None
             
             # Cache the data
-            self.cache[cache_key] = (data, datetime.now())
+            self._set_cached(cache_key, data)
             
             return data
             
@@ -42,6 +76,57 @@ class StockDataHandler:
             st.error(f"Error fetching stock data for {symbol}: {e}")
             return None
     
+    def get_multiple_stock_data(self, symbols: List[str], period: str = "1mo", interval: str = "1d") -> Dict[str, pd.DataFrame]:
+        """Fetch stock data for several symbols, downloading all uncached symbols in one batched request.
+
+        Results are keyed by upper-cased symbol.
+        """
+        results = {}
+        missing = []
+        for symbol in dict.fromkeys(symbol.upper() for symbol in symbols):
+            cached_data = self._get_cached((symbol, period, interval))
+            if cached_data is not None:
+                results[symbol] = cached_data
+            else:
+                missing.append(symbol)
+        
+        if not missing:
+            return results
+        
+        try:
+            data = yf.download(
+                missing,
+                period=period,
+                interval=interval,
+                group_by='ticker',
+                auto_adjust=True,
+                threads=True,
+                progress=False
+            )
+        except Exception as e:
+            st.error(f"Error fetching stock data for {', '.join(missing)}: {e}")
+            return results
+        
+        for symbol in missing:
+            if isinstance(data.columns, pd.MultiIndex):
+                if symbol not in data.columns.get_level_values(0):
+                    st.warning(f"No data found for symbol: {symbol}")
+                    continue
+                symbol_data = data[symbol]
+            else:
+                symbol_data = data
+            
+            # Tickers are aligned on a shared date index; drop dates this one did not trade
+            symbol_data = symbol_data.dropna(how='all')
+            if symbol_data.empty:
+                st.warning(f"No data found for symbol: {symbol}")
+                continue
+            
+            self._set_cached((symbol, period, interval), symbol_data)
+            results[symbol] = symbol_data
+        
+        return results
+    
     def get_stock_info(self, symbol: str) -> Dict:
         """Get basic stock information"""
         try:
@@ -65,6 +150,8 @@ class StockDataHandler:
     def create_stock_chart(self, data: pd.DataFrame, symbol: str, chart_type: str = "candlestick") -> go.Figure:
         """Create interactive stock chart"""
         try:
+            data = _downsample_ohlcv(data)
+            
             fig = make_subplots(
                 rows=2, cols=1,
                 shared_xaxes=True,
@@ -88,7 +175,7 @@ class StockDataHandler:
                 )
             else:
                 fig.add_trace(
-                    go.Scatter(
+                    go.Scattergl(
                         x=data.index,
                         y=data['Close'],
                         mode='lines',
@@ -134,15 +221,17 @@ class StockDataHandler:
         try:
             fig = go.Figure()
             
+            stock_data = self.get_multiple_stock_data(symbols, period)
             for symbol in symbols:
-                data = self.get_stock_data(symbol, period)
+                data = stock_data.get(symbol.upper())
                 if data is not None and not data.empty:
-                    # Normalize to percentage change
-                    normalized = (data['Close'] / data['Close'].iloc[0] - 1) * 100
+                    # Normalize to percentage change, keeping the first close of each bucket
+                    close = data['Close'].iloc[::_bucket_size(len(data))]
+                    normalized = (close / close.iloc[0] - 1) * 100
                     
                     fig.add_trace(
-                        go.Scatter(
-                            x=data.index,
+                        go.Scattergl(
+                            x=close.index,
                             y=normalized,
                             mode='lines',
                             name=symbol,
@@ -172,8 +261,9 @@ class StockDataHandler:
             if data is None or data.empty:
                 return {}
             
-            latest_price = data['Close'].iloc[-1]
-            first_price = data['Close'].iloc[0]
+            close = data['Close'].to_numpy(dtype=float)
+            latest_price = close[-1]
+            first_price = close[0]
             price_change = latest_price - first_price
             price_change_pct = (price_change / first_price) * 100
             
@@ -186,7 +276,7 @@ class StockDataHandler:
                 'high': round(data['High'].max(), 2),
                 'low': round(data['Low'].min(), 2),
                 'avg_volume': int(data['Volume'].mean()),
-                'volatility': round(data['Close'].pct_change().std() * 100, 2),
+                'volatility': round(np.nanstd(np.diff(close) / close[:-1], ddof=1) * 100, 2),
                 'trading_days': len(data)
             }
             
@@ -200,10 +290,12 @@ class StockDataHandler:
             if len(data) < window:
                 return "insufficient_data"
             
-            # Calculate short and long moving averages
-            short_ma = data['Close'].rolling(window=window).mean().iloc[-1]
-            long_ma = data['Close'].rolling(window=window*2).mean().iloc[-1]
-            current_price = data['Close'].iloc[-1]
+            # Moving averages at the last bar only need the trailing windows
+            close = data['Close'].to_numpy(dtype=float)
+            short_ma = close[-window:].mean()
+            # Like a rolling mean, the long average is undefined until a full window exists
+            long_ma = close[-window*2:].mean() if len(close) >= window*2 else np.nan
+            current_price = close[-1]
             
             if current_price > short_ma > long_ma:
                 return "uptrend"
@@ -0,0 +1,45 @@
+from typing import Iterator, Union
+import pypdfium2 as pdfium
+
+# Kept free of torch, sentence-transformers and streamlit imports: this module
+# is what PDF worker processes import, and they start with a fresh interpreter
+
+def iter_pdf_pages(source: Union[str, bytes]) -> Iterator[str]:
+    """Yield the text of each page of a PDF path or in-memory PDF, releasing native page buffers as we go"""
+    pdf = pdfium.PdfDocument(source)
+    try:
+        for page_index in range(len(pdf)):
+            page = pdf[page_index]
+            textpage = page.get_textpage()
+            try:
+                yield textpage.get_text_range()
+            finally:
+                textpage.close()
+                page.close()
+    finally:
+        pdf.close()
+
+def read_file(file_path: str, file_ext: str) -> str:
+    """Read content from a file based on its extension.
+
+    Runs in worker processes, so errors are raised to the caller instead of
+    being reported through streamlit.
+    """
+    if file_ext == '.txt':
+        with open(file_path, 'r', encoding='utf-8', errors='ignore') as file:
+            return file.read()
+    
+    elif file_ext == '.pdf':
+        return "\n".join(iter_pdf_pages(file_path))
+    
+    return ""
+
+def extract_text(data: bytes, file_ext: str) -> str:
+    """Extract text from in-memory file contents, mirroring read_file"""
+    if file_ext == '.txt':
+        return data.decode('utf-8', errors='ignore')
+    
+    elif file_ext == '.pdf':
+        return "\n".join(iter_pdf_pages(data))
+    
+    return ""
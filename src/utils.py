@@ -1,93 +1,124 @@
 import re
-from typing import List, Dict, Optional
+from functools import lru_cache
+from typing import List, Dict, Optional, Tuple
 import streamlit as st
 
+# Patterns compiled once at import instead of on every call
+_SYMBOL_RE = re.compile(r'\b[A-Z]{1,5}\b')
+_VALID_SYMBOL_RE = re.compile(r'^[A-Z]{1,5}$')
+_CLEAN_RE = re.compile(r'[^\w\s\-\.,!?()$%]')
+_REVENUE_RE = re.compile(r'revenue[:\s]*\$?(\d+(?:\.\d+)?)\s*(billion|million|b|m)?')
+_PROFIT_RE = re.compile(r'(?:profit|earnings|income)[:\s]*\$?(\d+(?:\.\d+)?)\s*(billion|million|b|m)?')
+_EPS_RE = re.compile(r'(?:eps|earnings per share)[:\s]*\$?(\d+(?:\.\d+)?)')
+_GROWTH_RE = re.compile(r'(?:growth|up|increase)[:\s]*(\d+(?:\.\d+)?)%')
+
+def compile_keyword_pattern(keywords) -> re.Pattern:
+    """Compile keywords into one alternation regex with plain substring semantics.
+
+    Longer keywords come first so the longest keyword starting at a position wins;
+    ties are ordered alphabetically so the pattern is the same in every process.
+    """
+    ordered = sorted(keywords, key=lambda keyword: (-len(keyword), keyword))
+    return re.compile('|'.join(re.escape(keyword) for keyword in ordered))
+
+_STOCK_KEYWORDS = frozenset({
+    'stock', 'share', 'shares', 'price', 'ticker', 'market', 'trading',
+    'volume', 'chart', 'performance', 'trend', 'bull', 'bear',
+    'nasdaq', 'nyse', 'sp500', 's&p', 'dow', 'equity', 'securities'
+})
+_STOCK_KEYWORDS_RE = compile_keyword_pattern(_STOCK_KEYWORDS)
+
+# Known major stock symbols
+_KNOWN_SYMBOLS = frozenset({
+    'AAPL', 'MSFT', 'GOOGL', 'GOOG', 'AMZN', 'TSLA', 'META', 'NFLX',
+    'NVDA', 'AMD', 'INTC', 'CRM', 'ORCL', 'IBM', 'ADBE', 'PYPL',
+    'UBER', 'LYFT', 'SPOT', 'TWTR', 'SNAP', 'PINS', 'SQ', 'SHOP',
+    'JPM', 'BAC', 'WFC', 'GS', 'MS', 'C', 'V', 'MA', 'AXP',
+    'JNJ', 'PFE', 'MRK', 'ABBV', 'TMO', 'UNH', 'CVS', 'WBA',
+    'KO', 'PEP', 'MCD', 'SBUX', 'NKE', 'DIS', 'HD', 'WMT',
+    'SPY', 'QQQ', 'IWM', 'VTI', 'VOO'  # ETFs
+})
+
+# Company name to symbol mapping
+_COMPANY_SYMBOLS = {
+    'apple': 'AAPL',
+    'microsoft': 'MSFT',
+    'google': 'GOOGL',
+    'alphabet': 'GOOGL',
+    'amazon': 'AMZN',
+    'tesla': 'TSLA',
+    'facebook': 'META',
+    'meta': 'META',
+    'netflix': 'NFLX',
+    'nvidia': 'NVDA',
+    'intel': 'INTC',
+    'amd': 'AMD',
+    'oracle': 'ORCL',
+    'salesforce': 'CRM',
+    'adobe': 'ADBE',
+    'paypal': 'PYPL',
+    'uber': 'UBER',
+    'spotify': 'SPOT',
+    'twitter': 'TWTR',
+    'snapchat': 'SNAP',
+    'pinterest': 'PINS',
+    'square': 'SQ',
+    'shopify': 'SHOP',
+    'jpmorgan': 'JPM',
+    'goldman': 'GS',
+    'visa': 'V',
+    'mastercard': 'MA',
+    'johnson': 'JNJ',
+    'pfizer': 'PFE',
+    'merck': 'MRK',
+    'cocacola': 'KO',
+    'coca-cola': 'KO',
+    'pepsi': 'PEP',
+    'mcdonald': 'MCD',
+    'mcdonalds': 'MCD',
+    'starbucks': 'SBUX',
+    'nike': 'NKE',
+    'disney': 'DIS',
+    'walmart': 'WMT',
+    'homedepot': 'HD'
+}
+
+# Zero-width lookahead so overlapping company names are all found in one scan
+_COMPANY_RE = re.compile(f'(?=({compile_keyword_pattern(_COMPANY_SYMBOLS).pattern}))')
+
+# Intent keywords, checked in priority order
+_INTENT_KEYWORDS = [
+    ('price_inquiry', frozenset({'price', 'cost', 'worth', 'value', 'trading at'})),
+    ('performance_inquiry', frozenset({'performance', 'trend', 'up', 'down', 'gain', 'loss'})),
+    ('comparison', frozenset({'compare', 'vs', 'versus', 'better', 'difference'})),
+    ('analysis_request', frozenset({'analyze', 'analysis', 'report', 'summary', 'review'})),
+    ('prediction_request', frozenset({'predict', 'forecast', 'future', 'will', 'expect'})),
+    ('news_inquiry', frozenset({'news', 'update', 'latest', 'recent', 'current'}))
+]
+_INTENT_PATTERNS = [(intent, compile_keyword_pattern(keywords)) for intent, keywords in _INTENT_KEYWORDS]
+
+@lru_cache(maxsize=1024)
 def is_stock_query(query: str) -> bool:
     """Determine if a query is stock-related"""
-    stock_keywords = [
-        'stock', 'share', 'shares', 'price', 'ticker', 'market', 'trading',
-        'volume', 'chart', 'performance', 'trend', 'bull', 'bear',
-        'nasdaq', 'nyse', 'sp500', 's&p', 'dow', 'equity', 'securities'
-    ]
-    
-    query_lower = query.lower()
-    return any(keyword in query_lower for keyword in stock_keywords)
+    return _STOCK_KEYWORDS_RE.search(query.lower()) is not None
 
 def extract_stock_symbols(query: str) -> List[str]:
     """Extract stock symbols from a query"""
-    # Common stock symbols (3-5 uppercase letters)
-    symbol_pattern = r'\b[A-Z]{1,5}\b'
-    potential_symbols = re.findall(symbol_pattern, query)
-    
-    # Known major stock symbols
-    known_symbols = {
-        'AAPL', 'MSFT', 'GOOGL', 'GOOG', 'AMZN', 'TSLA', 'META', 'NFLX',
-        'NVDA', 'AMD', 'INTC', 'CRM', 'ORCL', 'IBM', 'ADBE', 'PYPL',
-        'UBER', 'LYFT', 'SPOT', 'TWTR', 'SNAP', 'PINS', 'SQ', 'SHOP',
-        'JPM', 'BAC', 'WFC', 'GS', 'MS', 'C', 'V', 'MA', 'AXP',
-        'JNJ', 'PFE', 'MRK', 'ABBV', 'TMO', 'UNH', 'CVS', 'WBA',
-        'KO', 'PEP', 'MCD', 'SBUX', 'NKE', 'DIS', 'HD', 'WMT',
-        'SPY', 'QQQ', 'IWM', 'VTI', 'VOO'  # ETFs
-    }
-    
-    # Company name to symbol mapping
-    company_mappings = {
-        'apple': 'AAPL',
-        'microsoft': 'MSFT',
-        'google': 'GOOGL',
-        'alphabet': 'GOOGL',
-        'amazon': 'AMZN',
-        'tesla': 'TSLA',
-        'facebook': 'META',
-        'meta': 'META',
-        'netflix': 'NFLX',
-        'nvidia': 'NVDA',
-        'intel': 'INTC',
-        'amd': 'AMD',
-        'oracle': 'ORCL',
-        'salesforce': 'CRM',
-        'adobe': 'ADBE',
-        'paypal': 'PYPL',
-        'uber': 'UBER',
-        'spotify': 'SPOT',
-        'twitter': 'TWTR',
-        'snapchat': 'SNAP',
-        'pinterest': 'PINS',
-        'square': 'SQ',
-        'shopify': 'SHOP',
-        'jpmorgan': 'JPM',
-        'goldman': 'GS',
-        'visa': 'V',
-        'mastercard': 'MA',
-        'johnson': 'JNJ',
-        'pfizer': 'PFE',
-        'merck': 'MRK',
-        'cocacola': 'KO',
-        'coca-cola': 'KO',
-        'pepsi': 'PEP',
-        'mcdonald': 'MCD',
-        'mcdonalds': 'MCD',
-        'starbucks': 'SBUX',
-        'nike': 'NKE',
-        'disney': 'DIS',
-        'walmart': 'WMT',
-        'homedepot': 'HD'
-    }
-    
-    symbols = set()
+    # Copy so callers can't mutate the memoized result
+    return list(_extract_stock_symbols(query))
+
+@lru_cache(maxsize=1024)
+def _extract_stock_symbols(query: str) -> Tuple[str, ...]:
+    """Memoized symbol extraction; returns an immutable tuple"""
+    # Common stock symbols (3-5 uppercase letters), kept if they are known tickers
+    symbols = set(_SYMBOL_RE.findall(query)) & _KNOWN_SYMBOLS
     query_lower = query.lower()
     
-    # Add symbols found by pattern matching
-    for symbol in potential_symbols:
-        if symbol in known_symbols:
-            symbols.add(symbol)
-    
     # Add symbols found by company name matching
-    for company, symbol in company_mappings.items():
-        if company in query_lower:
-            symbols.add(symbol)
+    for match in _COMPANY_RE.finditer(query_lower):
+        symbols.add(_COMPANY_SYMBOLS[match.group(1)])
     
-    return list(symbols)
+    return tuple(symbols)
 
 def format_currency(amount: float, currency: str = "USD") -> str:
     """Format currency amount"""
@@ -118,16 +149,9 @@ def clean_text(text: str) -> str:
     if not text:
         return ""
     
-    # Remove extra whitespace
-    text = ' '.join(text.split())
-    
-    # Remove special characters but keep basic punctuation
-    text = re.sub(r'[^\w\s\-\.,!?()$%]', ' ', text)
-    
-    # Remove extra spaces
-    text = ' '.join(text.split())
-    
-    return text.strip()
+    # Remove special characters but keep basic punctuation, then collapse
+    # whitespace (including any runs the replacements created) in one pass
+    return ' '.join(_CLEAN_RE.sub(' ', text).split())
 
 def truncate_text(text: str, max_length: int = 100, add_ellipsis: bool = True) -> str:
     """Truncate text to specified length"""
@@ -140,10 +164,10 @@ def truncate_text(text: str, max_length: int = 100, add_ellipsis: bool = True) -
 def extract_financial_metrics(text: str) -> Dict:
     """Extract financial metrics from text"""
     metrics = {}
+    text_lower = text.lower()
     
     # Revenue patterns
-    revenue_pattern = r'revenue[:\s]*\$?(\d+(?:\.\d+)?)\s*(billion|million|b|m)?'
-    revenue_match = re.search(revenue_pattern, text.lower())
+    revenue_match = _REVENUE_RE.search(text_lower)
     if revenue_match:
         amount = float(revenue_match.group(1))
         unit = revenue_match.group(2)
@@ -154,8 +178,7 @@ def extract_financial_metrics(text: str) -> Dict:
         metrics['revenue'] = amount
     
     # Profit/earnings patterns
-    profit_pattern = r'(?:profit|earnings|income)[:\s]*\$?(\d+(?:\.\d+)?)\s*(billion|million|b|m)?'
-    profit_match = re.search(profit_pattern, text.lower())
+    profit_match = _PROFIT_RE.search(text_lower)
     if profit_match:
         amount = float(profit_match.group(1))
         unit = profit_match.group(2)
@@ -166,14 +189,12 @@ def extract_financial_metrics(text: str) -> Dict:
         metrics['profit'] = amount
     
     # EPS pattern
-    eps_pattern = r'(?:eps|earnings per share)[:\s]*\$?(\d+(?:\.\d+)?)'
-    eps_match = re.search(eps_pattern, text.lower())
+    eps_match = _EPS_RE.search(text_lower)
     if eps_match:
         metrics['eps'] = float(eps_match.group(1))
     
     # Growth percentage
-    growth_pattern = r'(?:growth|up|increase)[:\s]*(\d+(?:\.\d+)?)%'
-    growth_match = re.search(growth_pattern, text.lower())
+    growth_match = _GROWTH_RE.search(text_lower)
     if growth_match:
         metrics['growth'] = float(growth_match.group(1))
     
@@ -185,35 +206,15 @@ def validate_stock_symbol(symbol: str) -> bool:
         return False
     
     # Basic validation: 1-5 uppercase letters
-    return bool(re.match(r'^[A-Z]{1,5}$', symbol))
+    return bool(_VALID_SYMBOL_RE.match(symbol))
 
 def get_query_intent(query: str) -> str:
     """Determine the intent of a user query"""
     query_lower = query.lower()
     
-    # Price/value queries
-    if any(word in query_lower for word in ['price', 'cost', 'worth', 'value', 'trading at']):
-        return 'price_inquiry'
-    
-    # Performance/trend queries
-    if any(word in query_lower for word in ['performance', 'trend', 'up', 'down', 'gain', 'loss']):
-        return 'performance_inquiry'
-    
-    # Comparison queries
-    if any(word in query_lower for word in ['compare', 'vs', 'versus', 'better', 'difference']):
-        return 'comparison'
-    
-    # Analysis/report queries
-    if any(word in query_lower for word in ['analyze', 'analysis', 'report', 'summary', 'review']):
-        return 'analysis_request'
-    
-    # Prediction queries
-    if any(word in query_lower for word in ['predict', 'forecast', 'future', 'will', 'expect']):
-        return 'prediction_request'
-    
-    # News/update queries
-    if any(word in query_lower for word in ['news', 'update', 'latest', 'recent', 'current']):
-        return 'news_inquiry'
+    for intent, pattern in _INTENT_PATTERNS:
+        if pattern.search(query_lower):
+            return intent
     
     return 'general_inquiry'
 
@@ -1,32 +1,90 @@
+import os
+import json
+import pickle
 import faiss
 import numpy as np
-from typing import List, Dict, Tuple
+from pathlib import Path
+from typing import List, Dict, Optional, Tuple
 import streamlit as st
 
+# Embeddings are L2-normalized on the way in and searched by inner product, so
+# search scores are cosine similarities (higher is better) in FAISS's order
+
+# Storage precisions supported by the vector store, mapped to index_factory
+# storage codes; fp16 and int8 use FAISS's scalar quantizer, storing two or one
+# bytes per dimension (2x / 4x smaller than float32)
+PRECISIONS = {'float32': 'Flat', 'fp16': 'SQfp16', 'int8': 'SQ8'}
+
+# File names used when persisting an index directory
+INDEX_FILE = 'index.faiss'
+DOCUMENTS_FILE = 'documents.pkl'
+META_FILE = 'meta.json'
+
+# Header that introduces a document in the LLM context; formatted once per
+# document when it is indexed rather than on every query
+CONTEXT_PREFIX_FORMAT = "Document: {}\n"
+
+# Below this many vectors exact search is fast enough; above it an HNSW graph
+# keeps query time roughly logarithmic in the corpus size
+HNSW_MIN_VECTORS = 10_000
+DEFAULT_EF_SEARCH = 64
+
+# When an incremental add outgrows an int8 quantizer's trained range, the
+# retrained range is widened by this fraction on each side, so a growing corpus
+# triggers few retrains (each retrain requantizes every stored vector)
+SQ_RETRAIN_HEADROOM = 0.25
+
 class VectorStore:
-    def __init__(self):
+    def __init__(self, precision: str = 'float32'):
         """Initialize FAISS vector store"""
+        if precision not in PRECISIONS:
+            raise ValueError(f"Unsupported embedding precision: {precision}")
+        self.precision = precision
         self.index = None
+        self.index_type = None
         self.documents = []
         self.dimension = None
+        self._documents_by_id = {}
+        self._next_id = 0
+        
+        # Search-only GPU copy of the index; the CPU index stays authoritative
+        # for updates, persistence and reconstruction. Copying is O(N), so after
+        # adds and removals the copy is refreshed lazily by the next search.
+        self._gpu_index = None
+        self._gpu_resources = None
+        self._gpu_stale = False
     
-    def build_index(self, embeddings: List, documents: List[Dict]):
-        """Build FAISS index from embeddings and store documents"""
-        if not embeddings or not documents:
+    def build_index(self, embeddings: np.ndarray, documents: List[Dict], index_type: Optional[str] = None):
+        """Build FAISS index from embeddings and store documents.
+
+        index_type is a faiss.index_factory description such as "Flat", "HNSW32"
+        or "IVF1024,PQ32"; by default it is picked from the corpus size and precision.
+        """
+        if len(embeddings) == 0 or not documents:
             st.warning("No embeddings or documents provided for indexing")
             return
         
         try:
-            # Convert embeddings to numpy array
-            embeddings_array = np.array(embeddings, dtype=np.float32)
+            embeddings_array = self._prepare_vectors(embeddings)
             self.dimension = embeddings_array.shape[1]
             
-            # Create FAISS index
-            self.index = faiss.IndexFlatL2(self.dimension)
-            self.index.add(embeddings_array)
+            # Create FAISS index, wrapped in an ID map so documents can be
+            # added and removed later without rebuilding
+            self.index_type = index_type or self._default_index_type(len(embeddings_array))
+            self.index = self._create_index(self.dimension, self.index_type)
+            if not self.index.is_trained:
+                self.index.train(embeddings_array)
+            ids = np.arange(len(documents), dtype=np.int64)
+            self.index.add_with_ids(embeddings_array, ids)
             
             # Store documents
+            for doc_id, doc in zip(ids.tolist(), documents):
+                doc['id'] = doc_id
+            self._annotate_documents(documents)
             self.documents = documents
+            self._documents_by_id = {doc['id']: doc for doc in documents}
+            self._next_id = len(documents)
+            self._sync_gpu_index()
             
             st.success(f"✅ Built FAISS index with {len(documents)} documents")
             st.info(f"📐 Embedding dimension: {self.dimension}")
@@ -35,28 +93,106 @@ class VectorStore:
             st.error(f"Error building FAISS index: {e}")
             raise
     
-    def search(self, query_embedding: np.ndarray, top_k: int = 5) -> List[Tuple[int, float]]:
-        """Search for similar documents using query embedding"""
+    @staticmethod
+    def _prepare_vectors(embeddings: np.ndarray) -> np.ndarray:
+        """Return embeddings as contiguous, unit-length float32 rows, copying only when needed.
+
+        Embeddings from DocumentProcessor are already normalized float32, so they
+        are handed to FAISS as-is; anything else is copied and normalized so the
+        caller's array is never modified.
+        """
+        vectors = np.ascontiguousarray(embeddings, dtype=np.float32)
+        norms = np.linalg.norm(vectors, axis=1)
+        if not np.allclose(norms, 1.0, atol=1e-4):
+            vectors = vectors.copy()
+            faiss.normalize_L2(vectors)
+        return vectors
+    
+    @staticmethod
+    def _annotate_documents(documents: List[Dict]):
+        """Precompute the per-document pieces prepare_context needs on every query"""
+        for doc in documents:
+            doc['_ctx_prefix'] = CONTEXT_PREFIX_FORMAT.format(doc['filename'])
+            doc['_content_len'] = len(doc['content'])
+    
+    def _default_index_type(self, num_vectors: int) -> str:
+        """Pick an index_factory description for the corpus size and configured precision"""
+        storage = PRECISIONS[self.precision]
+        if num_vectors < HNSW_MIN_VECTORS:
+            return storage
+        return 'HNSW32' if storage == 'Flat' else f'HNSW32,{storage}'
+    
+    def _create_index(self, dimension: int, index_type: str):
+        """Create an ID-mapped FAISS index from an index_factory description"""
+        index = faiss.index_factory(dimension, f'IDMap2,{index_type}', faiss.METRIC_INNER_PRODUCT)
+        base = faiss.downcast_index(index.index)
+        if isinstance(base, faiss.IndexHNSW):
+            base.hnsw.efSearch = DEFAULT_EF_SEARCH
+        return index
+    
+    def _set_search_params(self, ef_search: Optional[int], nprobe: Optional[int]):
+        """Apply search-time accuracy/speed knobs to indexes that support them"""
+        base = faiss.downcast_index(self.index.index)
+        if ef_search is not None and isinstance(base, faiss.IndexHNSW):
+            base.hnsw.efSearch = ef_search
+        if nprobe is not None and isinstance(base, faiss.IndexIVF):
+            base.nprobe = nprobe
+            if self._gpu_index is not None:
+                faiss.GpuParameterSpace().set_index_parameter(self._gpu_index, 'nprobe', nprobe)
+    
+    def _invalidate_gpu_index(self):
+        """Drop the GPU copy after an update; the next search re-creates it"""
+        self._gpu_index = None
+        self._gpu_stale = True
+    
+    def _sync_gpu_index(self):
+        """Mirror the CPU index onto the available GPUs for search, if any"""
+        self._gpu_index = None
+        self._gpu_stale = False
+        num_gpus = faiss.get_num_gpus()
+        if self.index is None or num_gpus == 0:
+            return
+        
+        try:
+            if num_gpus > 1:
+                self._gpu_index = faiss.index_cpu_to_all_gpus(self.index)
+            else:
+                if self._gpu_resources is None:
+                    self._gpu_resources = faiss.StandardGpuResources()
+                self._gpu_index = faiss.index_cpu_to_gpu(self._gpu_resources, 0, self.index)
+        except Exception:
+            # Some index types (e.g. HNSW) have no GPU implementation; search stays on CPU
+            self._gpu_index = None
+    
+    def search(self, query_embedding: np.ndarray, top_k: int = 5, ef_search: Optional[int] = None,
+               nprobe: Optional[int] = None) -> List[Tuple[int, float]]:
+        """Search for similar documents, returning (id, cosine similarity) pairs best-first.
+
+        ef_search (HNSW) and nprobe (IVF) trade recall for speed when set.
+        """
         if self.index is None:
             st.error("Index not built. Please build the index first.")
             return []
         
         try:
-            # Ensure query embedding is the right shape and type
-            if isinstance(query_embedding, list):
-                query_embedding = np.array(query_embedding, dtype=np.float32)
+            # Ensure query embedding is a normalized float32 row; copy so the
+            # caller's vector is not normalized in place
+            query_embedding = np.array(query_embedding, dtype=np.float32).reshape(1, -1)
+            faiss.normalize_L2(query_embedding)
             
-            if len(query_embedding.shape) == 1:
-                query_embedding = query_embedding.reshape(1, -1)
+            if self._gpu_stale:
+                self._sync_gpu_index()
+            self._set_search_params(ef_search, nprobe)
             
-            # Search the index
-            distances, indices = self.index.search(query_embedding, min(top_k, len(self.documents)))
+            # Search the index, on the GPU copy when there is one
+            index = self._gpu_index if self._gpu_index is not None else self.index
+            scores, indices = index.search(query_embedding, min(top_k, len(self.documents)))
             
-            # Return results as (index, distance) tuples
+            # Return results as (index, similarity) tuples
             results = []
-            for i, (idx, distance) in enumerate(zip(indices[0], distances[0])):
+            for idx, score in zip(indices[0], scores[0]):
                 if idx != -1:  # Valid result
-                    results.append((int(idx), float(distance)))
+                    results.append((int(idx), float(score)))
             
             return results
             
@@ -66,17 +202,11 @@ class VectorStore:
     
     def get_document(self, doc_id: int) -> Dict:
         """Retrieve document by ID"""
-        if 0 <= doc_id < len(self.documents):
-            return self.documents[doc_id]
-        return {}
+        return self._documents_by_id.get(doc_id, {})
     
     def get_documents_by_indices(self, indices: List[int]) -> List[Dict]:
         """Retrieve multiple documents by their indices"""
-        documents = []
-        for idx in indices:
-            if 0 <= idx < len(self.documents):
-                documents.append(self.documents[idx])
-        return documents
+        return [self._documents_by_id[idx] for idx in indices if idx in self._documents_by_id]
     
     def get_index_stats(self) -> Dict:
         """Get statistics about the index"""
@@ -87,17 +217,20 @@ class VectorStore:
             "status": "Active",
             "total_documents": len(self.documents),
             "dimension": self.dimension,
-            "index_type": "FAISS IndexFlatL2",
+            "index_type": f"FAISS IndexIDMap2({type(faiss.downcast_index(self.index.index)).__name__})",
+            "index_factory": self.index_type,
+            "precision": self.precision,
+            "gpu": self._gpu_index is not None,
             "is_trained": self.index.is_trained,
             "ntotal": self.index.ntotal
         }
     
-    def rebuild_index(self, embeddings: List, documents: List[Dict]):
+    def rebuild_index(self, embeddings: np.ndarray, documents: List[Dict]):
         """Rebuild the index with new data"""
         st.info("Rebuilding FAISS index...")
         self.build_index(embeddings, documents)
     
-    def add_documents(self, embeddings: List, documents: List[Dict]):
+    def add_documents(self, embeddings: np.ndarray, documents: List[Dict]):
         """Add new documents to existing index"""
         if self.index is None:
             st.warning("No existing index found. Building new index...")
@@ -105,21 +238,180 @@ class VectorStore:
             return
         
         try:
-            # Convert new embeddings to numpy array
-            embeddings_array = np.array(embeddings, dtype=np.float32)
+            embeddings_array = self._prepare_vectors(embeddings)
             
-            # Add to existing index
-            self.index.add(embeddings_array)
+            # Add to existing index under fresh IDs
+            ids = np.arange(self._next_id, self._next_id + len(documents), dtype=np.int64)
+            if self._needs_retraining(embeddings_array):
+                self._rebuild_with(embeddings_array, ids)
+            else:
+                self.index.add_with_ids(embeddings_array, ids)
             
             # Update document store
-            start_id = len(self.documents)
-            for i, doc in enumerate(documents):
-                doc['id'] = start_id + i
+            for doc_id, doc in zip(ids.tolist(), documents):
+                doc['id'] = doc_id
+                self._documents_by_id[doc_id] = doc
+            self._annotate_documents(documents)
             
             self.documents.extend(documents)
+            self._next_id += len(documents)
+            self._invalidate_gpu_index()
             
             st.success(f"✅ Added {len(documents)} new documents to index")
             
         except Exception as e:
             st.error(f"Error adding documents to index: {e}")
-            raise
\ No newline at end of file
+            raise
+    
+    def remove_documents(self, doc_ids: List[int]):
+        """Remove documents from the existing index by ID"""
+        if self.index is None or not doc_ids:
+            return
+        
+        try:
+            ids = np.array(doc_ids, dtype=np.int64)
+            if isinstance(faiss.downcast_index(self.index.index), faiss.IndexHNSW):
+                removed = self._rebuild_without(ids)
+            else:
+                removed = self.index.remove_ids(ids)
+            
+            # Update document store
+            removed_ids = set(doc_ids)
+            self.documents = [doc for doc in self.documents if doc['id'] not in removed_ids]
+            for doc_id in removed_ids:
+                self._documents_by_id.pop(doc_id, None)
+            self._invalidate_gpu_index()
+            
+            st.success(f"✅ Removed {removed} documents from index")
+            
+        except Exception as e:
+            st.error(f"Error removing documents from index: {e}")
+            raise
+    
+    def save(self, directory: str, model_name: str):
+        """Persist the index, documents and a metadata sidecar so a later process can load them"""
+        if self.index is None:
+            return
+        
+        try:
+            path = Path(directory)
+            path.mkdir(parents=True, exist_ok=True)
+            
+            # Write everything to temporary files first, then swap them in
+            faiss.write_index(self.index, str(path / f'{INDEX_FILE}.tmp'))
+            with open(path / f'{DOCUMENTS_FILE}.tmp', 'wb') as file:
+                pickle.dump({'documents': self.documents, 'next_id': self._next_id}, file,
+                            protocol=pickle.HIGHEST_PROTOCOL)
+            with open(path / f'{META_FILE}.tmp', 'w') as file:
+                json.dump({
+                    'model_name': model_name,
+                    'precision': self.precision,
+                    'index_type': self.index_type,
+                    'dimension': self.dimension
+                }, file)
+            
+            for name in (INDEX_FILE, DOCUMENTS_FILE, META_FILE):
+                os.replace(path / f'{name}.tmp', path / name)
+        except Exception as e:
+            st.warning(f"Unable to persist FAISS index: {e}")
+    
+    def load(self, directory: str, model_name: str) -> bool:
+        """Load a persisted index memory-mapped from disk; returns False if it is absent or stale"""
+        path = Path(directory)
+        if not all((path / name).exists() for name in (INDEX_FILE, DOCUMENTS_FILE, META_FILE)):
+            return False
+        
+        try:
+            with open(path / META_FILE) as file:
+                meta = json.load(file)
+            if meta.get('model_name') != model_name or meta.get('precision') != self.precision:
+                return False
+            
+            # Memory-map the index so pages are faulted in only as searches touch them;
+            # later adds and removals work on private copies and never write the file
+            index = faiss.read_index(str(path / INDEX_FILE), faiss.IO_FLAG_MMAP | faiss.IO_FLAG_READ_ONLY)
+            with open(path / DOCUMENTS_FILE, 'rb') as file:
+                stored = pickle.load(file)
+            if index.ntotal != len(stored['documents']):
+                return False
+        except Exception as e:
+            st.warning(f"Ignoring unreadable FAISS index: {e}")
+            return False
+        
+        self.index = index
+        self.index_type = meta['index_type']
+        self.dimension = meta['dimension']
+        self.documents = stored['documents']
+        self._annotate_documents(self.documents)
+        self._documents_by_id = {doc['id']: doc for doc in self.documents}
+        self._next_id = stored['next_id']
+        self._sync_gpu_index()
+        return True
+    
+    def _needs_retraining(self, vectors: np.ndarray) -> bool:
+        """Check whether adding vectors to a trained index would encode them poorly.
+
+        A scalar quantizer is trained on per-dimension value ranges and clips
+        anything outside them, so it is retrained only when new vectors leave the
+        trained range; other trained index types are always retrained.
+        """
+        if self._create_index(self.dimension, self.index_type).is_trained:
+            return False
+        
+        quantizer = self._scalar_quantizer(self.index)
+        if quantizer is None:
+            return True
+        vmin, vdiff = np.split(faiss.vector_to_array(quantizer.sq.trained), 2)
+        return bool((vectors < vmin).any() or (vectors > vmin + vdiff).any())
+    
+    @staticmethod
+    def _scalar_quantizer(index):
+        """Return the IndexScalarQuantizer holding an index's vectors, or None for other storage"""
+        base = faiss.downcast_index(index.index)
+        if isinstance(base, faiss.IndexHNSW):
+            base = faiss.downcast_index(base.storage)
+        return base if isinstance(base, faiss.IndexScalarQuantizer) else None
+    
+    def _rebuild_with(self, vectors: np.ndarray, ids: np.ndarray):
+        """Add vectors by retraining a fresh index on the stored vectors plus the new ones.
+
+        Stored vectors are reconstructed from the old codes and requantized, which
+        costs them some precision each time; training with SQ_RETRAIN_HEADROOM
+        keeps later adds inside the range so this rarely repeats.
+        """
+        stored_ids = faiss.vector_to_array(self.index.id_map)
+        stored = self.index.index.reconstruct_n(0, self.index.ntotal)
+        self._rebuild(np.vstack([stored, vectors]), np.concatenate([stored_ids, ids]), headroom=SQ_RETRAIN_HEADROOM)
+    
+    def _rebuild_without(self, ids: np.ndarray) -> int:
+        """Remove IDs from an index type without remove_ids support by re-adding the remaining vectors"""
+        stored_ids = faiss.vector_to_array(self.index.id_map)
+        vectors = self.index.index.reconstruct_n(0, self.index.ntotal)
+        keep = ~np.isin(stored_ids, ids)
+        # Keep any headroom an earlier retrain gave the quantizer
+        quantizer = self._scalar_quantizer(self.index)
+        headroom = quantizer.sq.rangestat_arg if quantizer is not None else 0.0
+        self._rebuild(vectors[keep], stored_ids[keep], headroom=headroom)
+        return int((~keep).sum())
+    
+    def _rebuild(self, vectors: np.ndarray, ids: np.ndarray, headroom: float = 0.0):
+        """Replace the index with a freshly trained one holding exactly these vectors"""
+        index = self._create_index(self.dimension, self.index_type)
+        quantizer = self._scalar_quantizer(index)
+        if quantizer is not None:
+            quantizer.sq.rangestat_arg = headroom
+        if not index.is_trained:
+            index.train(vectors)
+        index.add_with_ids(vectors, ids)
+        self.index = index
+    
+    def clear(self):
+        """Drop the index and all stored documents"""
+        self.index = None
+        self.index_type = None
+        self.documents = []
+        self.dimension = None
+        self._documents_by_id = {}
+        self._next_id = 0
+        self._gpu_index = None
+        self._gpu_stale = False
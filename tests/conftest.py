@@ -0,0 +1,80 @@
+import sys
+import types
+from contextlib import nullcontext
+
+import hashlib
+
+import numpy as np
+import pytest
+
+def pytest_addoption(parser):
+    parser.addoption(
+        "--no-streamlit",
+        action="store_true",
+        help="import the real streamlit instead of installing the no-op stand-in",
+    )
+
+def pytest_configure(config):
+    # Stand-in for streamlit, installed before src is imported so the tests never
+    # pay for the real import; the processor only uses these no-op UI calls
+    if config.getoption("--no-streamlit"):
+        return
+    fake_streamlit = types.ModuleType("streamlit")
+    fake_streamlit.error = fake_streamlit.warning = fake_streamlit.success = fake_streamlit.info = (
+        lambda *args, **kwargs: None
+    )
+    fake_streamlit.spinner = lambda *args, **kwargs: nullcontext()
+    sys.modules["streamlit"] = fake_streamlit
+
+class StubEncoder:
+    """Deterministic stand-in for SentenceTransformer that hashes each text to a unit vector"""
+    dimension = 16
+
+    def __init__(self):
+        self.encoded = []
+
+    def encode(self, sentences, **kwargs):
+        self.encoded.extend(sentences)
+        vectors = np.array([
+            np.random.default_rng(int(hashlib.sha256(text.encode()).hexdigest()[:8], 16)).standard_normal(self.dimension)
+            for text in sentences
+        ], dtype=np.float32).reshape(len(sentences), self.dimension)
+        return vectors / np.linalg.norm(vectors, axis=1, keepdims=True)
+
+    def get_sentence_embedding_dimension(self):
+        return self.dimension
+
+
+@pytest.fixture
+def stub_encoder(monkeypatch):
+    """Make DocumentProcessor and QueryProcessor load a StubEncoder instead of a real model"""
+    import src.document_processor
+    import src.query_processor
+
+    encoder = StubEncoder()
+    monkeypatch.setattr(src.document_processor, "load_encoder", lambda model_name: encoder)
+    monkeypatch.setattr(src.query_processor, "load_encoder", lambda model_name: encoder)
+    return encoder
+
+
+@pytest.fixture(scope="session")
+def processor():
+    """One DocumentProcessor (and loaded encoder) shared by the whole test session"""
+    # Imported here so pytest_configure has decided which streamlit src sees
+    from src.document_processor import DocumentProcessor
+    return DocumentProcessor()
+
+
+@pytest.fixture(scope="session")
+def sample_files():
+    """Sample file payloads keyed by file name: one unreadable PDF and one valid text file"""
+    return {"bad.pdf": b"Not a PDF content", "good.txt": b"Hello world"}
+
+
+@pytest.fixture(scope="session")
+def docs_dir(tmp_path_factory, sample_files):
+    """Directory holding the sample files, written once per session"""
+    directory = tmp_path_factory.mktemp("docs")
+    for name, payload in sample_files.items():
+        (directory / name).write_bytes(payload)
+    return directory
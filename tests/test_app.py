@@ -0,0 +1,71 @@
+import sys
+from unittest import mock
+
+import numpy as np
+import pytest
+
+from src.response_cache import SemanticResponseCache
+
+
+@pytest.fixture
+def app(monkeypatch):
+    """Import app.py against a mock streamlit, so its page setup calls are no-ops"""
+    monkeypatch.setitem(sys.modules, "streamlit", mock.MagicMock())
+    sys.modules.pop("app", None)
+    import app as module
+    yield module
+    sys.modules.pop("app", None)
+
+
+class FakeLLMHandler:
+    """stream_response stand-in yielding the given chunks and returning completed"""
+
+    def __init__(self, chunks, completed=True):
+        self.chunks = chunks
+        self.completed = completed
+
+    def stream_response(self, query, document_context="", stock_data=""):
+        yield from self.chunks
+        return self.completed
+
+
+def make_system(llm_handler):
+    query_processor = mock.Mock()
+    query_processor.encode_query.return_value = np.array([1.0, 0.0], dtype=np.float32)
+    query_processor.retrieve_documents.return_value = []
+    query_processor.order_for_context.return_value = []
+    return {
+        'sample_query_vecs': {},
+        'query_processor': query_processor,
+        'vector_store': mock.Mock(),
+        'llm_handler': llm_handler,
+        'response_cache': SemanticResponseCache(),
+    }
+
+
+def answer(app, system, query):
+    response_data = app.process_query(system, query)
+    streamed = "".join(response_data["answer_stream"])
+    return response_data, streamed
+
+
+@pytest.mark.parametrize("chunks, completed", [
+    pytest.param([], True, id="no_text_parts"),
+    pytest.param(["   "], True, id="blank_text"),
+    pytest.param(["canned fallback"], False, id="fallback"),
+])
+def test_unusable_answers_are_not_cached(app, chunks, completed):
+    system = make_system(FakeLLMHandler(chunks, completed))
+    answer(app, system, "summarize the report")
+    assert system['response_cache'].get(np.array([1.0, 0.0])) is None
+
+
+def test_complete_answer_is_cached(app):
+    system = make_system(FakeLLMHandler(["Revenue ", "grew."]))
+    response_data, streamed = answer(app, system, "summarize the report")
+    assert streamed == "Revenue grew."
+    assert response_data["answer"] == "Revenue grew."
+
+    cached = app.process_query(system, "summarize the report")
+    assert cached["answer"] == "Revenue grew."
+    assert "answer_stream" not in cached
@@ -1,70 +1,111 @@
 import os
 import sys
-import unittest
-from pathlib import Path
-
-# Add project root to sys.path
-sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
-
-from src.document_processor import DocumentProcessor
-
-class TestDocumentProcessor(unittest.TestCase):
-    def setUp(self):
-        # Mock streamlit to avoid errors during init if it uses st.error
-        import streamlit
-        self.original_error = streamlit.error
-        self.original_warning = streamlit.warning
-        self.original_success = streamlit.success
-        self.original_spinner = streamlit.spinner
-        
-        streamlit.error = lambda x: print(f"ST ERROR: {x}")
-        streamlit.warning = lambda x: print(f"ST WARNING: {x}")
-        streamlit.success = lambda x: print(f"ST SUCCESS: {x}")
-        # Mock spinner context manager
-        class MockSpinner:
-            def __enter__(self): pass
-            def __exit__(self, exc_type, exc_val, exc_tb): pass
-        streamlit.spinner = lambda x: MockSpinner()
-
-        self.processor = DocumentProcessor()
-        self.test_dir = "tests/test_docs"
-        os.makedirs(self.test_dir, exist_ok=True)
-
-    def tearDown(self):
-        import streamlit
-        streamlit.error = self.original_error
-        streamlit.warning = self.original_warning
-        streamlit.success = self.original_success
-        streamlit.spinner = self.original_spinner
-        
-        # Clean up test files
-        if os.path.exists(self.test_dir):
-            for f in os.listdir(self.test_dir):
-                os.remove(os.path.join(self.test_dir, f))
-            os.rmdir(self.test_dir)
-
-    def test_load_empty_directory(self):
-        docs = self.processor.load_documents(self.test_dir)
-        self.assertEqual(len(docs), 0)
-
-    def test_load_bad_pdf(self):
-        # Create a dummy bad PDF
-        bad_pdf_path = os.path.join(self.test_dir, "bad.pdf")
-        with open(bad_pdf_path, "wb") as f:
-            f.write(b"Not a PDF content")
-        
-        # Should not crash and return empty list (or list without that file)
-        docs = self.processor.load_documents(self.test_dir)
-        self.assertEqual(len(docs), 0)
-
-    def test_load_valid_txt(self):
-        txt_path = os.path.join(self.test_dir, "good.txt")
-        with open(txt_path, "w") as f:
-            f.write("Hello world")
-        
-        docs = self.processor.load_documents(self.test_dir)
-        self.assertEqual(len(docs), 1)
-        self.assertEqual(docs[0]['content'], "Hello world")
-
-if __name__ == '__main__':
-    unittest.main()
+from unittest import mock
+
+import pytest
+
+@pytest.mark.parametrize("subdirectory", [
+    pytest.param("", id="empty_directory"),
+    pytest.param("missing", id="missing_directory"),
+])
+def test_load_directory_without_documents(processor, tmp_path, subdirectory):
+    docs = processor.load_documents(str(tmp_path / subdirectory))
+    assert len(docs) == 0
+
+@pytest.mark.parametrize("names, expected_names", [
+    pytest.param([], [], id="empty"),
+    # A dummy bad PDF should not crash and yields no documents
+    pytest.param(["bad.pdf"], [], id="bad_pdf"),
+    pytest.param(["good.txt"], ["good.txt"], id="valid_txt"),
+])
+def test_load_documents_from_bytes(processor, sample_files, names, expected_names):
+    docs = processor.load_documents_from_bytes({name: sample_files[name] for name in names})
+    assert [doc['content'] for doc in docs] == [sample_files[name].decode() for name in expected_names]
+
+def test_load_documents_skips_unreadable_files(processor, sample_files, docs_dir):
+    docs = processor.load_documents(str(docs_dir))
+    assert [doc['content'] for doc in docs] == [sample_files["good.txt"].decode()]
+
+def test_load_files_extracts_pdfs_in_worker_processes(stub_encoder, sample_files, tmp_path):
+    canvas = pytest.importorskip("reportlab.pdfgen.canvas")
+    from src.document_processor import DocumentProcessor
+
+    paths = []
+    for name in ("first", "second"):
+        pdf = canvas.Canvas(str(tmp_path / f"{name}.pdf"))
+        pdf.drawString(72, 720, f"{name} quarter revenue")
+        pdf.save()
+        paths.append(str(tmp_path / f"{name}.pdf"))
+    (tmp_path / "bad.pdf").write_bytes(sample_files["bad.pdf"])
+    paths.append(str(tmp_path / "bad.pdf"))
+
+    processor = DocumentProcessor()
+    docs = processor.load_files(paths)
+    assert [doc['content'].strip() for doc in docs] == ["first quarter revenue", "second quarter revenue"]
+    assert processor._pdf_executor is not None
+
+@pytest.mark.parametrize("word_count, expected_windows", [
+    pytest.param(0, [], id="empty"),
+    pytest.param(4, [(0, 4)], id="shorter_than_chunk"),
+    pytest.param(5, [(0, 5)], id="exactly_one_chunk"),
+    pytest.param(11, [(0, 5), (3, 8), (6, 11)], id="overlapping"),
+    pytest.param(12, [(0, 5), (3, 8), (6, 11), (9, 12)], id="short_tail"),
+])
+def test_chunk_text_windows(stub_encoder, word_count, expected_windows):
+    from src.document_processor import DocumentProcessor
+
+    words = [f"w{i}" for i in range(word_count)]
+    processor = DocumentProcessor(chunk_size=5, chunk_overlap=2)
+    chunks = processor._chunk_text("  " + "\n".join(words) + "  ")
+    assert [chunk.split() for chunk in chunks] == [words[start:end] for start, end in expected_windows]
+    # Chunks keep the original separators between words
+    assert all("\n" in chunk for chunk in chunks if len(chunk.split()) > 1)
+
+def test_pdf_workers_do_not_rerun_the_main_script(stub_encoder, sample_files, tmp_path, monkeypatch):
+    import types
+    from src.document_processor import DocumentProcessor, _script_free_main
+
+    # Under Streamlit __main__ is the app script; workers must not execute it
+    marker = tmp_path / "app_imported"
+    script = tmp_path / "app.py"
+    script.write_text(f"open({str(marker)!r}, 'w').close()\nimport streamlit\n")
+    main = types.ModuleType("__main__")
+    main.__file__ = str(script)
+    monkeypatch.setitem(sys.modules, "__main__", main)
+
+    paths = []
+    for name in ("one.pdf", "two.pdf"):
+        (tmp_path / name).write_bytes(sample_files["bad.pdf"])
+        paths.append(str(tmp_path / name))
+
+    processor = DocumentProcessor()
+    assert processor.load_files(paths) == []
+    assert processor._pdf_executor is not None
+    assert not marker.exists()
+
+    with _script_free_main():
+        worker_modules = processor._pdf_executor.submit(eval, "set(__import__('sys').modules)").result()
+    assert not {"app", "streamlit", "torch"} & worker_modules
+
+def test_file_cache_prunes_removed_files_without_rescanning(stub_encoder, tmp_path):
+    from src.document_processor import DocumentProcessor
+
+    paths = []
+    for name in ("keep.txt", "drop.txt", "gone.txt"):
+        (tmp_path / name).write_text(f"{name} contents")
+        paths.append(str(tmp_path / name))
+    keep, drop, gone = paths
+    cache_dir = str(tmp_path / "cache")
+    processor = DocumentProcessor(cache_dir=cache_dir)
+
+    # Reading and forgetting files must not stat every cached path
+    with mock.patch("os.path.exists", side_effect=os.path.exists) as exists:
+        processor.load_files(paths)
+        os.remove(drop)
+        processor.forget_files([drop])
+    assert exists.call_count == 0
+    assert sorted(processor._file_cache) == sorted([keep, gone])
+
+    # Files deleted while the app was down are dropped on the next start
+    os.remove(gone)
+    assert sorted(DocumentProcessor(cache_dir=cache_dir)._file_cache) == [keep]
@@ -0,0 +1,50 @@
+import numpy as np
+
+from src.document_processor import DocumentProcessor
+
+
+def make_documents(*contents):
+    return [{'content': content} for content in contents]
+
+
+def test_cached_embeddings_skip_the_encoder(stub_encoder):
+    processor = DocumentProcessor()
+    first = processor.generate_embeddings(make_documents("alpha", "beta", "alpha"))
+    assert stub_encoder.encoded == ["alpha", "beta"]
+
+    second = processor.generate_embeddings(make_documents("beta", "alpha"))
+    assert stub_encoder.encoded == ["alpha", "beta"]
+    np.testing.assert_array_equal(second, first[[1, 0]])
+
+
+def test_cache_persists_across_processors(stub_encoder, tmp_path):
+    DocumentProcessor(cache_dir=str(tmp_path)).generate_embeddings(make_documents("alpha"))
+    DocumentProcessor(cache_dir=str(tmp_path)).generate_embeddings(make_documents("beta"))
+    assert len(list((tmp_path / "embeddings").glob("*.npz"))) == 2
+
+    processor = DocumentProcessor(cache_dir=str(tmp_path))
+    processor.generate_embeddings(make_documents("alpha", "beta"))
+    assert stub_encoder.encoded == ["alpha", "beta"]
+
+
+def test_retain_embeddings_drops_stale_chunks(stub_encoder, tmp_path):
+    processor = DocumentProcessor(cache_dir=str(tmp_path))
+    processor.generate_embeddings(make_documents("alpha"))
+    processor.generate_embeddings(make_documents("beta"))
+    processor.retain_embeddings(make_documents("beta"))
+    assert len(list((tmp_path / "embeddings").glob("*.npz"))) == 1
+
+    reloaded = DocumentProcessor(cache_dir=str(tmp_path))
+    assert len(reloaded._cache_vectors) == 1
+    reloaded.generate_embeddings(make_documents("alpha", "beta"))
+    assert stub_encoder.encoded == ["alpha", "beta", "alpha"]
+
+
+def test_retain_embeddings_ignores_empty_document_list(stub_encoder, tmp_path):
+    processor = DocumentProcessor(cache_dir=str(tmp_path))
+    processor.generate_embeddings(make_documents("alpha", "beta"))
+    processor.retain_embeddings([])
+
+    reloaded = DocumentProcessor(cache_dir=str(tmp_path))
+    reloaded.generate_embeddings(make_documents("alpha", "beta"))
+    assert stub_encoder.encoded == ["alpha", "beta"]
@@ -0,0 +1,71 @@
+import types
+
+import pytest
+
+from src.llm_handler import INTERRUPTED_RESPONSE_NOTICE, LLMHandler
+
+
+class FakeModel:
+    """Gemini model stand-in that streams the given chunks (None for a chunk with no parts), then optionally raises"""
+
+    def __init__(self, chunks, error=None):
+        self.chunks = chunks
+        self.error = error
+
+    def generate_content(self, prompt, stream=False):
+        for text in self.chunks:
+            yield types.SimpleNamespace(parts=[text] if text is not None else [], text=text)
+        if self.error is not None:
+            raise self.error
+
+
+def drain(stream):
+    parts = []
+    while True:
+        try:
+            parts.append(next(stream))
+        except StopIteration as stop:
+            return parts, stop.value
+
+
+@pytest.fixture
+def handler(monkeypatch):
+    monkeypatch.delenv("GOOGLE_API_KEY", raising=False)
+    return LLMHandler()
+
+
+def test_stream_response_reports_complete_answer(handler):
+    handler.client_initialized = True
+    handler.assistant_model = FakeModel(["Revenue ", "grew."])
+    assert drain(handler.stream_response("revenue?")) == (["Revenue ", "grew."], True)
+
+
+def test_stream_response_ends_partial_answer_with_notice(handler):
+    handler.client_initialized = True
+    handler.assistant_model = FakeModel(["Revenue "], error=RuntimeError("quota exceeded"))
+    parts, completed = drain(handler.stream_response("revenue?"))
+    assert parts == ["Revenue ", INTERRUPTED_RESPONSE_NOTICE]
+    assert completed is False
+
+
+def test_stream_response_falls_back_when_failing_before_text(handler):
+    handler.client_initialized = True
+    handler.assistant_model = FakeModel([], error=RuntimeError("quota exceeded"))
+    parts, completed = drain(handler.stream_response("revenue?"))
+    assert parts == [handler._fallback_response("revenue?", "", "")]
+    assert completed is False
+
+
+def test_stream_response_falls_back_when_no_text_parts(handler):
+    handler.client_initialized = True
+    # A blocked candidate (e.g. finish_reason=SAFETY) streams chunks with no parts
+    handler.assistant_model = FakeModel([None])
+    parts, completed = drain(handler.stream_response("revenue?"))
+    assert parts == [handler._fallback_response("revenue?", "", "")]
+    assert completed is False
+
+
+def test_stream_response_reports_fallback_without_api_key(handler):
+    parts, completed = drain(handler.stream_response("revenue?"))
+    assert len(parts) == 1
+    assert completed is False
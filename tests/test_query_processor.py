@@ -0,0 +1,109 @@
+import threading
+import time
+
+import numpy as np
+import pytest
+
+from src.query_processor import QueryProcessor, _QueryBatcher
+
+
+class Interrupted(BaseException):
+    pass
+
+
+def wait_for(condition, timeout=5.0):
+    deadline = time.monotonic() + timeout
+    while not condition():
+        assert time.monotonic() < deadline, "timed out"
+        time.sleep(0.001)
+
+
+def embed(texts):
+    return np.array([[float(len(text))] for text in texts], dtype=np.float32)
+
+
+def test_concurrent_queries_share_a_batch_and_leadership_is_handed_off():
+    release = threading.Event()
+    batches = []
+
+    def encode_batch(texts):
+        batches.append((threading.current_thread().name, list(texts)))
+        if texts == ["first"]:
+            release.wait()
+        return embed(texts)
+
+    batcher = _QueryBatcher(encode_batch)
+    results = {}
+    threads = [threading.Thread(target=lambda text=text: results.update({text: batcher.encode(text)}), name=text)
+               for text in ("first", "bb", "ccc")]
+    threads[0].start()
+    wait_for(lambda: batches)
+    for thread in threads[1:]:
+        thread.start()
+    wait_for(lambda: len(batcher._pending) == 2)
+    release.set()
+    for thread in threads:
+        thread.join(timeout=5)
+
+    assert {text: float(vector[0]) for text, vector in results.items()} == {"first": 5.0, "bb": 2.0, "ccc": 3.0}
+    # The first leader stops after its own batch; a waiting caller encodes the rest
+    assert batches[0] == ("first", ["first"])
+    assert batches[1][0] in ("bb", "ccc") and sorted(batches[1][1]) == ["bb", "ccc"]
+
+
+def test_errors_reach_every_caller_in_the_batch():
+    def encode_batch(texts):
+        raise ValueError("model failed")
+
+    batcher = _QueryBatcher(encode_batch)
+    with pytest.raises(ValueError):
+        batcher.encode("query")
+    assert batcher._busy is False
+
+
+def test_interrupted_leader_does_not_wedge_the_batcher():
+    calls = []
+
+    def encode_batch(texts):
+        calls.append(list(texts))
+        if len(calls) == 1:
+            raise Interrupted()
+        return embed(texts)
+
+    batcher = _QueryBatcher(encode_batch)
+    with pytest.raises(Interrupted):
+        batcher.encode("first")
+    assert batcher._busy is False
+    assert float(batcher.encode("second")[0]) == 6.0
+
+
+def test_encode_query_is_cached_and_read_only(stub_encoder):
+    processor = QueryProcessor()
+    first = processor.encode_query("apple revenue")
+    second = processor.encode_query("apple revenue")
+    assert stub_encoder.encoded == ["apple revenue"]
+    np.testing.assert_array_equal(first, second)
+    assert not first.flags.writeable
+
+
+def test_retrieved_context_is_ordered_by_source(stub_encoder):
+    from src.vector_store import VectorStore
+
+    documents = [
+        {'filename': name, 'path': name, 'chunk_id': chunk_id, 'content': f"{name} part {chunk_id}"}
+        for name, chunk_id in [("b.txt", 1), ("a.txt", 0), ("b.txt", 0)]
+    ]
+    store = VectorStore()
+    store.build_index(stub_encoder.encode([doc['content'] for doc in documents]), documents)
+
+    processor = QueryProcessor()
+    results = processor.retrieve_documents("b.txt part 1", store, top_k=3)
+    assert results[0]['doc']['content'] == "b.txt part 1"
+    assert results[0]['score'] == pytest.approx(1.0, abs=1e-5)
+    assert [item['score'] for item in results] == sorted((item['score'] for item in results), reverse=True)
+
+    context = processor.prepare_context(results)
+    assert [line for line in context.splitlines() if line.startswith("Document:")] == [
+        "Document: a.txt", "Document: b.txt", "Document: b.txt"
+    ]
+    assert context.index("b.txt part 0") < context.index("b.txt part 1")
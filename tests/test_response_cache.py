@@ -0,0 +1,64 @@
+import numpy as np
+import pytest
+
+import src.response_cache
+from src.response_cache import SemanticResponseCache
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 1000.0
+
+    def __call__(self):
+        return self.now
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    fake = FakeClock()
+    monkeypatch.setattr(src.response_cache.time, "monotonic", fake)
+    return fake
+
+
+def vector(*values):
+    return np.array(values, dtype=np.float32)
+
+
+def test_similar_query_hits_and_dissimilar_misses(clock):
+    cache = SemanticResponseCache(threshold=0.95)
+    cache.put(vector(1, 0, 0), {"answer": "a"})
+    assert cache.get(vector(2, 0.1, 0)) == {"answer": "a"}
+    assert cache.get(vector(0, 1, 0)) is None
+
+
+def test_key_must_match(clock):
+    cache = SemanticResponseCache()
+    cache.put(vector(1, 0), {"answer": "apple"}, ("AAPL",))
+    assert cache.get(vector(1, 0), ("MSFT",)) is None
+    assert cache.get(vector(1, 0), ("AAPL",)) == {"answer": "apple"}
+
+
+def test_entries_expire_after_ttl(clock):
+    cache = SemanticResponseCache(ttl_seconds=60)
+    cache.put(vector(1, 0), {"answer": "old"})
+    clock.now += 30
+    cache.put(vector(0, 1), {"answer": "new"})
+    clock.now += 31
+    assert cache.get(vector(1, 0)) is None
+    assert cache.get(vector(0, 1)) == {"answer": "new"}
+
+
+def test_oldest_entry_is_evicted_when_full(clock):
+    cache = SemanticResponseCache(max_entries=2)
+    for i, values in enumerate([(1, 0, 0), (0, 1, 0), (0, 0, 1)]):
+        cache.put(vector(*values), {"answer": i})
+    assert cache.get(vector(1, 0, 0)) is None
+    assert cache.get(vector(0, 1, 0)) == {"answer": 1}
+    assert cache.get(vector(0, 0, 1)) == {"answer": 2}
+
+
+def test_clear_drops_everything(clock):
+    cache = SemanticResponseCache()
+    cache.put(vector(1, 0), {"answer": "a"})
+    cache.clear()
+    assert cache.get(vector(1, 0)) is None
@@ -0,0 +1,95 @@
+import faiss
+import numpy as np
+import pytest
+
+from src.vector_store import VectorStore
+
+
+def unit_vectors(count, dimension=32, seed=0):
+    vectors = np.random.default_rng(seed).standard_normal((count, dimension)).astype(np.float32)
+    return vectors / np.linalg.norm(vectors, axis=1, keepdims=True)
+
+
+def make_documents(count, start=0):
+    return [{'filename': f"doc{i}.txt", 'content': f"chunk {i}", 'path': f"doc{i}.txt", 'chunk_id': 0}
+            for i in range(start, start + count)]
+
+
+@pytest.mark.parametrize("precision", ["fp16", "int8"])
+@pytest.mark.parametrize("batch_size", [2995, 30])
+def test_incremental_adds_keep_recall(precision, batch_size):
+    vectors = unit_vectors(3000)
+    store = VectorStore(precision=precision)
+    store.build_index(vectors[:5], make_documents(5))
+    for start in range(5, len(vectors), batch_size):
+        batch = vectors[start:start + batch_size]
+        store.add_documents(batch, make_documents(len(batch), start=start))
+
+    exact = faiss.IndexFlatIP(vectors.shape[1])
+    exact.add(vectors)
+    queries = unit_vectors(50, seed=1)
+    _, expected = exact.search(queries, 10)
+    hits = sum(len({doc_id for doc_id, _ in store.search(query, 10)} & set(row))
+               for query, row in zip(queries, expected))
+    assert hits / expected.size >= 0.9
+
+    for doc_id in (0, 2999):
+        best_id, score = store.search(vectors[doc_id], 1)[0]
+        assert best_id == doc_id
+        assert score == pytest.approx(1.0, abs=0.02)
+
+
+@pytest.mark.parametrize("index_type", ["Flat", "HNSW32"])
+def test_add_and_remove_keep_stable_ids(index_type):
+    vectors = unit_vectors(20)
+    store = VectorStore()
+    store.build_index(vectors[:10], make_documents(10), index_type=index_type)
+    store.add_documents(vectors[10:], make_documents(10, start=10))
+    assert [doc['id'] for doc in store.documents] == list(range(20))
+
+    store.remove_documents([3, 15])
+    assert store.index.ntotal == 18
+    assert store.get_document(3) == {} and store.get_document(15) == {}
+    # Remaining documents keep their IDs and are still found by their own vectors
+    for doc_id in (0, 14, 19):
+        assert store.search(vectors[doc_id], 1)[0][0] == doc_id
+        assert store.get_document(doc_id)['content'] == f"chunk {doc_id}"
+    assert 3 not in {doc_id for doc_id, _ in store.search(vectors[3], 20)}
+
+    # New documents never reuse removed IDs
+    store.add_documents(vectors[:1], make_documents(1, start=20))
+    assert store.documents[-1]['id'] == 20
+
+
+def test_save_and_load_round_trip(tmp_path):
+    vectors = unit_vectors(12)
+    store = VectorStore(precision="fp16")
+    store.build_index(vectors, make_documents(12))
+    store.remove_documents([4])
+    store.save(str(tmp_path), "model-a")
+
+    loaded = VectorStore(precision="fp16")
+    assert loaded.load(str(tmp_path), "model-a")
+    assert [doc['id'] for doc in loaded.documents] == [doc['id'] for doc in store.documents]
+    assert loaded.search(vectors[7], 3) == store.search(vectors[7], 3)
+
+    # The memory-mapped index still accepts updates without touching the saved file
+    saved = (tmp_path / "index.faiss").read_bytes()
+    loaded.add_documents(vectors[:1], make_documents(1, start=12))
+    assert loaded.documents[-1]['id'] == 12
+    assert (tmp_path / "index.faiss").read_bytes() == saved
+
+
+@pytest.mark.parametrize("model_name, precision", [
+    pytest.param("model-b", "fp16", id="other_model"),
+    pytest.param("model-a", "int8", id="other_precision"),
+])
+def test_load_rejects_stale_index(tmp_path, model_name, precision):
+    store = VectorStore(precision="fp16")
+    store.build_index(unit_vectors(4), make_documents(4))
+    store.save(str(tmp_path), "model-a")
+    assert not VectorStore(precision=precision).load(str(tmp_path), model_name)
+
+
+def test_load_without_saved_index(tmp_path):
+    assert not VectorStore().load(str(tmp_path), "model-a")